@@ -1,15 +1,49 @@
-from fastapi import FastAPI, UploadFile, File, Form, Request
-from pydantic import BaseModel
-from src.Statistics import statistics_generator
-from src.CountryDefiner import identify_country_by_prefix
-from src.FindAbonnent import find_abonnent
-from src.ChartsCreation import chart_generation
-from src.Similarities import group_similar_values_across_sources
-from typing import List, Optional
-import json
+from fastapi import FastAPI, UploadFile, File, Form, Query, Request, HTTPException, Response, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, model_validator
+from src.Statistics import statistics_generator, StatisticsStream
+from src.CountryDefiner import get_country_index
+from src.CityDefiner import get_city_index
+from src.FindAbonnent import load_subscriber_store
+from src.Enrichment import enrich_numbers
+from src.RenderPool import submit_render, get_render_job, shutdown as shutdown_render_pool
+from src.Similarities import group_similar_values_across_sources, index_calls, SimilarityIndex, SpooledCallStore
+from src.Sessions import session_store
+from src.CallStore import load_call_store
+from src.TimeIndex import get_time_index
+from src.IngestPool import iter_source, spool_to_disk, submit_source, shutdown as shutdown_ingest_pool
+from src.StreamingJson import CallUploadStream, iter_json_list, iter_and_close
+from src.FastJson import FastJSONResponse, json_body, json_body_schema
+from src.Metrics import PROFILE_SAMPLE_RATE, collect_timings, request_seconds, render_metrics, server_timing
+from src.ResultCache import result_cache, canonical_hash, file_hash
+from xml_converter import iter_calls
+from contextlib import asynccontextmanager
+from typing import List, Literal, Optional
+import xml.etree.ElementTree as ET
+import asyncio
+import gzip
+import inspect
+import os
+import random
 import time
+import zlib
 
-app = FastAPI(debug=True, port=8030)
+@asynccontextmanager
+async def lifespan(app):
+    """Loads the prefix indexes and the subscriber store once, and stops the worker pools on shutdown."""
+    get_country_index()
+    get_city_index()
+    load_subscriber_store()
+    yield
+    shutdown_render_pool()
+    shutdown_ingest_pool()
+
+app = FastAPI(debug=True, port=8030, default_response_class=FastJSONResponse, lifespan=lifespan)
+
+# Malformed XML, or a truncated / corrupt .xml.gz, in an uploaded report
+XML_REPORT_ERRORS = (ET.ParseError, gzip.BadGzipFile, EOFError, zlib.error)
 
 class Filters(BaseModel):
     type: Optional[str] = None
@@ -17,6 +51,28 @@ class Filters(BaseModel):
     phone_number: Optional[str] = None
     start_time: Optional[str] = None
     end_time: Optional[str] = None
+    # Match any of several values; empty lists do not filter
+    types: Optional[List[str]] = None
+    apps: Optional[List[str]] = None
+    phone_numbers: Optional[List[str]] = None
+    status: Optional[str] = None
+    min_duration: Optional[float] = None
+    max_duration: Optional[float] = None
+    # Matches the raw or the normalized (+7...) number
+    number_prefix: Optional[str] = None
+
+def filter_params(param):
+    """
+    Dependency reading every Filters field from `param` (Query or Form) parameters and
+    returning the filters dict, so endpoints without a JSON body share one filter model.
+    """
+    def parse(**values):
+        return Filters(**values).model_dump()
+    parse.__signature__ = inspect.Signature([
+        inspect.Parameter(name, inspect.Parameter.KEYWORD_ONLY, default=param(None), annotation=field.annotation)
+        for name, field in Filters.model_fields.items()
+    ])
+    return parse
 
 class Call(BaseModel):
     type: Optional[str] = None
@@ -28,9 +84,26 @@ class Call(BaseModel):
     name: Optional[str] = None
 
 class CallHistory(BaseModel):
-    call_history: List[Call]
+    call_history: Optional[List[Call]] = None
+    # Id of a case loaded through /cases/, used instead of call_history
+    case_id: Optional[str] = None
     filters: Optional[Filters] = None
     language: Optional[str]
+    # Adds contact_details (subscriber identity, country, prefix) for every key contact
+    enrich: Optional[bool] = False
+    # Starts a chart render job (see /charts/) and returns its render_job_id
+    charts: Optional[bool] = False
+    chart_format: Optional[Literal['html', 'png', 'svg']] = 'html'
+    # Only return the top_k most called contacts, plus a key_contacts_others total
+    top_k: Optional[int] = Field(None, ge=1)
+    # Count contacts with a bounded approximate sketch (for millions of distinct numbers)
+    contact_sketch: Optional[bool] = False
+
+    @model_validator(mode='after')
+    def check_calls(self):
+        if (self.call_history is None) == (self.case_id is None):
+            raise ValueError("Either call_history or case_id is required")
+        return self
 
 class SimilaritySource(BaseModel):
     source: str
@@ -40,109 +113,456 @@ class SimilarityRequest(BaseModel):
     sources: List[SimilaritySource]
     target_field: Optional[str] = None
     target_value: Optional[str] = None
+    # Return each call once in 'calls' and reference it by index from the groups
+    compact: Optional[bool] = False
+    # Match numbers by their E.164 form instead of the raw string
+    normalize_numbers: Optional[bool] = False
+    # Also group calls from different sources whose timestamps are at most this many seconds apart
+    time_window: Optional[float] = None
+
+class SessionRequest(BaseModel):
+    filters: Optional[Filters] = None
+    enrich: Optional[bool] = False
+    top_k: Optional[int] = Field(None, ge=1)
+    contact_sketch: Optional[bool] = False
+
+class CallBatch(BaseModel):
+    call_history: List[Call]
+
+# Add a Server-Timing header with the stage breakdown to every response, not only to requests asking for it
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+def wants_timing(request):
+    return (
+        SERVER_TIMING or
+        request.headers.get("x-timing", "").lower() in ("1", "true") or
+        request.query_params.get("timing", "").lower() in ("1", "true")
+    )
 
 @app.middleware("http")
 async def log_request_time(request: Request, call_next):
+    """
+    Times every request and its pipeline stages (validation, hashing, statistics, serialization...)
+    for /metrics. Requests with an 'X-Timing: 1' header or '?timing=1' also get per-accumulator
+    stages and a Server-Timing header; PROFILE_SAMPLE_RATE samples requests for cProfile capture.
+    """
     start_time = time.time()
-    response = await call_next(request)
+    detailed = wants_timing(request)
+    profile = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    with collect_timings(detailed, profile) as timings:
+        response = await call_next(request)
     elapsed_time = time.time() - start_time
+    route = request.scope.get("route")
+    path = route.path if route is not None else request.url.path
+    request_seconds.observe((request.method, path, str(response.status_code)), elapsed_time)
+    if detailed:
+        response.headers["Server-Timing"] = server_timing({**timings, "total": elapsed_time})
     print(f"Request {request.url.path} processed in {elapsed_time:.4f} seconds")
     return response
 
-@app.post("/")
-def read_root(data: CallHistory):
-    calls = data.model_dump().get("call_history")
-    language = data.model_dump().get("language")
-    statistics = statistics_generator(calls)
-    chart_generation(statistics, language)
+@app.get("/metrics")
+def metrics():
+    """Stage and request time histograms in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+def statistics_options(enrich, top_k=None, contact_sketch=False):
+    """Keyword arguments of statistics_generator that change the result, also part of cache keys."""
+    return {"enrich": bool(enrich), "top_k": top_k, "contact_sketch": bool(contact_sketch)}
+
+def charts_response(response, statistics, charts, language, chart_format):
+    """The endpoint response; with `charts` a render job is started and its id added as render_job_id."""
+    if charts:
+        response["render_job_id"] = submit_render(statistics, language, chart_format)
+    return FastJSONResponse(response)
+
+def case_statistics(endpoint, case_id, filters, options):
+    """Statistics of a stored case; the filters run as indexed SQLite queries."""
+    store = load_call_store()
+    case = store.case_info(case_id)
+    if case is None:
+        raise HTTPException(status_code=404, detail="Unknown case")
+    # The call count changes whenever calls are appended, so it versions the cached result
+    cache_key = canonical_hash({"endpoint": endpoint, "case": case, "filters": filters, **options})
+    statistics = result_cache.get(cache_key)
+    if statistics is None:
+        statistics = statistics_generator(store.iter_records(case_id, filters), **options)
+        result_cache.set(cache_key, statistics)
     return statistics
 
-@app.post("/filters/")
-def filtered_data(data: CallHistory):
-    test_database_path = 'test_database.json'
-    with open(test_database_path, 'r', encoding='utf-8') as file:
-        test_database = json.load(file)
-    with open('test_operator_database.json', 'r', encoding='utf-8') as file:
-        operator_data = json.load(file)
-    abonnents = operator_data["abonnents"]
-    calls = data.model_dump().get("call_history")
-    filters = data.model_dump().get("filters")
-    language = data.model_dump().get("language")
-    abonnent = None
-    country = None
-    prefix = None
-    if filters.get("phone_number") is not None:
-        abonnent = find_abonnent(abonnents, filters.get("phone_number"))
-    if abonnent:
-        print(abonnent.get("phoneNumber", ""), "|", abonnent.get("lastName", ""), "|", abonnent.get("firstName", ""))
+@app.post("/", openapi_extra=json_body_schema(CallHistory))
+def read_root(data: CallHistory = Depends(json_body(CallHistory))):
+    payload = data.model_dump()
+    calls = payload.get("call_history")
+    language = payload.get("language")
+    options = statistics_options(data.enrich, data.top_k, data.contact_sketch)
+    if data.case_id is not None:
+        statistics = case_statistics("/", data.case_id, None, options)
+    else:
+        # The chart language does not change the statistics, so it is not part of the key
+        cache_key = canonical_hash({"endpoint": "/", "call_history": calls, **options})
+        statistics = result_cache.get(cache_key)
+        if statistics is None:
+            statistics = statistics_generator(calls, **options)
+            result_cache.set(cache_key, statistics)
+    return charts_response(dict(statistics), statistics, data.charts, language, data.chart_format)
+
+@app.post("/filters/", openapi_extra=json_body_schema(CallHistory))
+def filtered_data(data: CallHistory = Depends(json_body(CallHistory))):
+    payload = data.model_dump()
+    calls = payload.get("call_history")
+    filters = payload.get("filters")
+    language = payload.get("language")
+    phone_number_details = None
     if filters.get("phone_number") is not None:
-        country = identify_country_by_prefix(filters.get("phone_number"))
-    if country:
-        operator = "test"
-        print(country, "|", operator)
-    statistics = statistics_generator(calls, filters)
-    chart_generation(statistics, language)
-    return statistics
+        phone_number_details = enrich_numbers([filters.get("phone_number")]).get(filters.get("phone_number"))
+    options = statistics_options(data.enrich, data.top_k, data.contact_sketch)
+    if data.case_id is not None:
+        statistics = case_statistics("/filters/", data.case_id, filters, options)
+    else:
+        # The history is hashed once, for the result cache and the time index
+        calls_hash = canonical_hash(calls)
+        cache_key = canonical_hash({"endpoint": "/filters/", "call_history": calls_hash, "filters": filters, **options})
+        statistics = result_cache.get(cache_key)
+        if statistics is None:
+            if filters.get("start_time") or filters.get("end_time"):
+                # Time ranges are answered by bisecting the cached, time-sorted history
+                records = get_time_index(calls_hash, calls).select(filters)
+                statistics = statistics_generator(records, **options)
+            else:
+                statistics = statistics_generator(calls, filters, **options)
+            result_cache.set(cache_key, statistics)
+    response = {**statistics, "phone_number_details": phone_number_details}
+    return charts_response(response, statistics, data.charts, language, data.chart_format)
+
+@app.post("/xml/")
+async def xml_report_statistics(
+    report: UploadFile = File(...),
+    language: Optional[str] = Form('ru'),
+    charts: Optional[bool] = Form(False),
+    chart_format: Optional[Literal['html', 'png', 'svg']] = Form('html'),
+    enrich: Optional[bool] = Form(False),
+    top_k: Optional[int] = Form(None, ge=1),
+    contact_sketch: Optional[bool] = Form(False),
+    filters: dict = Depends(filter_params(Form))
+):
+    """
+    Accepts a Cellebrite XML report (optionally gzipped) and returns the same statistics as /filters/.
+    Calls are streamed from the XML parser straight into the statistics accumulators,
+    without converting the report to JSON first. Filters are passed as form fields.
+    """
+    report_hash = await run_in_threadpool(file_hash, report.file)
+    options = statistics_options(enrich, top_k, contact_sketch)
+    cache_key = canonical_hash({"endpoint": "/xml/", "report": report_hash, "filters": filters, **options})
+    statistics = result_cache.get(cache_key)
+    if statistics is None:
+        try:
+            statistics = await run_in_threadpool(statistics_generator, iter_calls(report.file), filters, **options)
+        except XML_REPORT_ERRORS as e:
+            return {"error": f"Error parsing XML in file {report.filename}: {e}"}
+        result_cache.set(cache_key, statistics)
+    return charts_response(dict(statistics), statistics, charts, language, chart_format)
+
+call_list = TypeAdapter(List[Call])
+
+def validate_calls(calls, offset):
+    """Validates a batch of streamed calls like CallHistory.call_history and returns them as dicts."""
+    try:
+        return call_list.dump_python(call_list.validate_python(calls))
+    except ValidationError as e:
+        raise RequestValidationError([
+            {**error, "loc": ("body", offset + error["loc"][0], *error["loc"][1:])}
+            for error in e.errors(include_url=False)
+        ])
+
+class StreamIngest:
+    """Parses, validates and aggregates one streamed upload chunk by chunk."""
+
+    def __init__(self, ndjson, filters, options):
+        self.upload = CallUploadStream(ndjson)
+        self.statistics = StatisticsStream(filters, **options)
+        self.received = 0
+
+    def _add(self, calls):
+        self.statistics.add_many(validate_calls(calls, self.received))
+        self.received += len(calls)
 
+    def feed(self, chunk):
+        self._add(self.upload.feed(chunk))
 
-@app.post("/similarities/")
-def find_similarities(data: SimilarityRequest):
+    def close(self):
+        self._add(self.upload.close())
+        return self.statistics.result()
+
+def is_ndjson(content_type):
+    return any(kind in (content_type or "").lower() for kind in ("ndjson", "jsonl", "json-seq"))
+
+@app.post("/stream/")
+async def stream_statistics(
+    request: Request,
+    language: Optional[str] = 'ru',
+    charts: Optional[bool] = False,
+    chart_format: Optional[Literal['html', 'png', 'svg']] = 'html',
+    enrich: Optional[bool] = False,
+    top_k: Optional[int] = Query(None, ge=1),
+    contact_sketch: Optional[bool] = False,
+    filters: dict = Depends(filter_params(Query))
+):
+    """
+    Same statistics as /filters/ for call histories too large for one JSON body.
+    The body is newline-delimited calls (Content-Type application/x-ndjson),
+    or a JSON array of calls / {"call_history": [...]} sent in chunks; options and
+    filters are query parameters. Calls are fed into the accumulators as each
+    chunk arrives, so memory does not grow with the number of calls.
+    """
+    options = statistics_options(enrich, top_k, contact_sketch)
+    ingest = StreamIngest(is_ndjson(request.headers.get("content-type")), filters, options)
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                await run_in_threadpool(ingest.feed, chunk)
+        statistics = await run_in_threadpool(ingest.close)
+    except KeyError:
+        return {"error": "Body does not contain 'call_history'"}
+    except (ValueError, UnicodeDecodeError) as e:
+        return {"error": f"Error parsing JSON body: {e}"}
+    phone_number = filters.get("phone_number")
+    phone_number_details = enrich_numbers([phone_number]).get(phone_number) if phone_number is not None else None
+    response = {**statistics, "phone_number_details": phone_number_details}
+    return charts_response(response, statistics, charts, language, chart_format)
+
+@app.post("/sessions/")
+def create_session(data: SessionRequest):
+    """
+    Starts an analysis that receives its calls in several deliveries.
+    Filters and enrich are fixed for the lifetime of the session.
+    """
+    filters = data.filters.model_dump() if data.filters is not None else None
+    return {"session_id": session_store.create(filters, statistics_options(data.enrich, data.top_k, data.contact_sketch))}
+
+def get_session(session_id):
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return session
+
+@app.post("/sessions/{session_id}/calls", openapi_extra=json_body_schema(CallBatch))
+def append_session_calls(session_id: str, data: CallBatch = Depends(json_body(CallBatch))):
+    """Merges a batch of calls into the session statistics, in time proportional to the batch."""
+    session = get_session(session_id)
+    return session.add_many(call_list.dump_python(data.call_history))
+
+@app.get("/sessions/{session_id}")
+def read_session(
+    session_id: str,
+    language: Optional[str] = 'ru',
+    chart_format: Optional[Literal['html', 'png', 'svg']] = 'html',
+    charts: Optional[bool] = False
+):
+    """Current statistics of the session; with 'charts' a render job is started for them as well."""
+    session = get_session(session_id)
+    statistics = session.result()
+    return charts_response({**statistics, "session": session.info()}, statistics, charts, language, chart_format)
+
+@app.delete("/sessions/{session_id}")
+def delete_session(session_id: str):
+    if not session_store.delete(session_id):
+        raise HTTPException(status_code=404, detail="Unknown session")
+    return {"deleted": session_id}
+
+@app.post("/cases/", openapi_extra=json_body_schema(CallBatch))
+def create_case(data: CallBatch = Depends(json_body(CallBatch))):
+    """
+    Loads the calls of a case once into the call store. / and /filters/ then accept
+    its case_id instead of a call_history, and filters become index scans.
+    """
+    store = load_call_store()
+    try:
+        case_id = store.create_case(call_list.dump_python(data.call_history))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid call: {e}")
+    return store.case_info(case_id)
+
+@app.post("/cases/{case_id}/calls", openapi_extra=json_body_schema(CallBatch))
+def append_case_calls(case_id: str, data: CallBatch = Depends(json_body(CallBatch))):
+    store = load_call_store()
+    try:
+        count = store.add_calls(case_id, call_list.dump_python(data.call_history))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid call: {e}")
+    if count is None:
+        raise HTTPException(status_code=404, detail="Unknown case")
+    return store.case_info(case_id)
+
+@app.get("/cases/{case_id}")
+def read_case(case_id: str):
+    case = load_call_store().case_info(case_id)
+    if case is None:
+        raise HTTPException(status_code=404, detail="Unknown case")
+    return case
+
+@app.delete("/cases/{case_id}")
+def delete_case(case_id: str):
+    if not load_call_store().delete_case(case_id):
+        raise HTTPException(status_code=404, detail="Unknown case")
+    return {"deleted": case_id}
+
+@app.get("/charts/{job_id}")
+def get_charts(job_id: str):
+    """
+    Returns the state of a chart render job started with 'charts' by /, /filters/, /xml/, /stream/ or a session.
+    Once done, the response is a zip with all charts in the requested
+    chart_format (one charts.html page, or one png/svg per chart).
+    """
+    job = get_render_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown render job")
+    if job["status"] != "done":
+        return job
+    return Response(
+        content=job["charts"],
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="charts_{job_id}.zip"'}
+    )
+
+
+@app.post("/similarities/", openapi_extra=json_body_schema(SimilarityRequest))
+def find_similarities(data: SimilarityRequest = Depends(json_body(SimilarityRequest))):
     """
     Accepts multiple JSON sources (each with its own call_history),
     annotates each call with its source, finds any similarities
     (shared key–value pairs across calls from different sources),
     and optionally filters the result by a specific field.
     """
+    payload = data.model_dump()
+    cache_key = canonical_hash({"endpoint": "/similarities/", **payload})
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return FastJSONResponse(cached)
+
     all_calls = []
-    for source_item in data.sources:
-        source = source_item.source
-        # Convert each Call (Pydantic model) to a dict and add its 'source'
-        for call in source_item.call_history:
-            call_dict = call.model_dump()
+    for source_item in payload["sources"]:
+        source = source_item["source"]
+        # The calls were dumped to dicts once above, only their 'source' is added
+        for call_dict in source_item["call_history"]:
             call_dict["source"] = source
             all_calls.append(call_dict)
     
-    result = group_similar_values_across_sources(all_calls)
-    
-    # Filter result by target_field if provided
-    if data.target_field:
-        result = [group for group in result if group["field"] == data.target_field]
+    # Only target_field is pushed down; this endpoint has never filtered by target_value
+    result = group_similar_values_across_sources(
+        all_calls,
+        target_field=data.target_field or None,
+        compact=bool(data.compact),
+        normalize_numbers=bool(data.normalize_numbers),
+        time_window=data.time_window
+    )
     
     # (Optional) Write the result to a file
     # write_result_to_file(result)
     
-    return result
+    result_cache.set(cache_key, result)
+    return FastJSONResponse(result)
+
+def source_error(filename, error):
+    """The {"error": ...} message of an uploaded source that could not be decoded."""
+    if isinstance(error, KeyError):
+        return f"File {filename} does not contain 'call_history'"
+    if isinstance(error, XML_REPORT_ERRORS):
+        return f"Error parsing XML in file {filename}: {error}"
+    return f"Error parsing JSON in file {filename}: {error}"
 
 @app.post("/similarities_files/")
 async def find_similarities_from_files(
     sources: List[UploadFile] = File(...),
     target_field: Optional[str] = Form(None),
-    target_value: Optional[str] = Form(None)
+    target_value: Optional[str] = Form(None),
+    stream: Optional[bool] = Form(False),
+    compact: Optional[bool] = Form(False),
+    normalize_numbers: Optional[bool] = Form(False),
+    time_window: Optional[float] = Form(None)
 ):
     """
     Accepts multiple JSON files (each containing a 'call_history') as file uploads.
+    Cellebrite XML reports (.xml / .xml.gz) are accepted as well and parsed directly.
+    Files are decoded in parallel in the ingest worker processes (INGEST_WORKERS),
+    except with 'stream', where each file is decoded incrementally to keep memory bounded.
     Each call is annotated with the source (the file name). Then, calls are grouped by similar
     key–value pairs that appear in calls from at least two different sources.
     
     Optional form fields 'target_field' and 'target_value' can be used to filter the results.
+    With 'stream' set, calls are spooled to a temporary file instead of being kept in memory
+    and the groups are streamed out one by one (such responses are not cached).
+    With 'compact' the response is {"groups": [...], "calls": [...]}, every call listed once
+    and referenced from the groups by index, with per-source counts on each group.
+    'normalize_numbers' matches numbers by their E.164 form and 'time_window' (seconds) adds
+    'time_window' groups of calls from different sources that happened close together.
     """
-    all_calls = []
+    file_hashes = []
     for source_file in sources:
-        contents = await source_file.read()
+        file_hashes.append([source_file.filename, await run_in_threadpool(file_hash, source_file.file)])
+    cache_key = canonical_hash({
+        "endpoint": "/similarities_files/",
+        "files": file_hashes,
+        "target_field": target_field,
+        "target_value": target_value,
+        "compact": compact,
+        "normalize_numbers": normalize_numbers,
+        "time_window": time_window
+    })
+    if not stream:
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            return FastJSONResponse(cached)
+
+    index = SimilarityIndex(
+        SpooledCallStore() if stream else None,
+        target_field=target_field or None,
+        target_value=target_value or None,
+        normalize_numbers=bool(normalize_numbers),
+        time_window=time_window
+    )
+    error = None
+    if stream:
+        # Streamed responses keep memory bounded: each file is decoded incrementally
+        # in a thread, straight into the spooled index
+        for source_file in sources:
+            try:
+                calls = iter_source(source_file.file, source_file.filename)
+                await run_in_threadpool(index_calls, index, calls, source_file.filename)
+            except Exception as e:
+                error = source_error(source_file.filename, e)
+                break
+    else:
+        # Every file is decoded in a worker process; calls are merged in upload order
+        # as soon as a file and all files before it are done, so results do not depend on timing
+        paths = [await run_in_threadpool(spool_to_disk, source_file.file) for source_file in sources]
+        futures = [submit_source(path, source_file.filename) for path, source_file in zip(paths, sources)]
         try:
-            data = json.loads(contents.decode('utf-8'))
-        except Exception as e:
-            return {"error": f"Error parsing JSON in file {source_file.filename}: {e}"}
-        if "call_history" in data:
-            for call in data["call_history"]:
-                call["source"] = source_file.filename
-                all_calls.append(call)
-        else:
-            return {"error": f"File {source_file.filename} does not contain 'call_history'"}
-    result = group_similar_values_across_sources(all_calls)
-    if target_field:
-        result = [group for group in result if group["field"] == target_field]
-    if target_value:
-        result = [group for group in result if str(group["value"]) == target_value]
+            for future, source_file in zip(futures, sources):
+                try:
+                    calls = await asyncio.wrap_future(future)
+                except Exception as e:
+                    error = source_error(source_file.filename, e)
+                    break
+                await run_in_threadpool(index_calls, index, calls, source_file.filename)
+        finally:
+            for future in futures:
+                future.cancel()
+            for path in paths:
+                os.unlink(path)
+    if error is not None:
+        if stream:
+            index.calls.close()
+        return {"error": error}
+
+    if stream:
+        chunks = index.iter_compact_json() if compact else iter_json_list(index.iter_groups())
+        return StreamingResponse(iter_and_close(chunks, index.calls.close), media_type="application/json")
+    result = index.compact_result() if compact else list(index.iter_groups())
     # (Optional) write_result_to_file(result)
-    return result
\ No newline at end of file
+    result_cache.set(cache_key, result)
+    return FastJSONResponse(result)
+
+@app.get("/cache/")
+def cache_statistics():
+    """Hit/miss counters and memory usage of the result cache."""
+    return result_cache.stats()
\ No newline at end of file
@@ -0,0 +1,350 @@
+from collections import defaultdict
+from functools import partial
+from src.CountryDefiner import get_country_index
+from src.CityDefiner import identify_city
+from src.Enrichment import contact_details
+from src.Metrics import detailed_timings, record
+import heapq
+import os
+import time
+
+
+class IncomingOutgoingAccumulator:
+    def __init__(self):
+        self.incoming = 0
+        self.outgoing = 0
+
+    def add(self, val):
+        call_type = val.type
+        if call_type == "incoming":
+            self.incoming += 1
+        elif call_type == "outgoing":
+            self.outgoing += 1
+
+    def result(self):
+        return {"incoming": self.incoming, "outgoing": self.outgoing}
+
+
+class CallDurationAccumulator:
+    def __init__(self, incoming_calls=None, outgoing_calls=None):
+        # Explicit amounts override the counted ones (legacy get_call_duration_statistics signature)
+        self.incoming_calls = incoming_calls
+        self.outgoing_calls = outgoing_calls
+        self.total = {"amount": 0, "sum": 0, "max": float('-inf'), "min": float('inf')}
+        self.by_type = {
+            "incoming": {"amount": 0, "sum": 0, "max": float('-inf'), "min": float('inf')},
+            "outgoing": {"amount": 0, "sum": 0, "max": float('-inf'), "min": float('inf')},
+        }
+
+    @staticmethod
+    def _update(bucket, duration):
+        bucket["amount"] += 1
+        bucket["sum"] += duration
+        if duration > bucket["max"]:
+            bucket["max"] = duration
+        if duration < bucket["min"]:
+            bucket["min"] = duration
+
+    def add(self, val):
+        duration = val.duration
+        self._update(self.total, duration)
+        bucket = self.by_type.get(val.type)
+        if bucket is not None:
+            self._update(bucket, duration)
+
+    def result(self):
+        if not self.total["amount"]:
+            empty = {'amount': 0, 'average_duration': 0, 'max_duration': 0, 'min_duration': 0}
+            return {"call_duration": {
+                'total_calls': dict(empty),
+                'incoming_calls': dict(empty),
+                'outgoing_calls': dict(empty)
+            }}
+
+        incoming_calls = self.by_type["incoming"]["amount"] if self.incoming_calls is None else self.incoming_calls
+        outgoing_calls = self.by_type["outgoing"]["amount"] if self.outgoing_calls is None else self.outgoing_calls
+
+        def section(bucket, amount):
+            average_duration = bucket["sum"] / amount if amount else 0
+            return {
+                'amount': amount,
+                'average_duration': round(average_duration, 1),
+                'max_duration': bucket["max"],
+                'min_duration': bucket["min"] if bucket["min"] != float('inf') else 0
+            }
+
+        return {"call_duration": {
+            'total_calls': section(self.total, self.total["amount"]),
+            'incoming_calls': section(self.by_type["incoming"], incoming_calls),
+            'outgoing_calls': section(self.by_type["outgoing"], outgoing_calls)
+        }}
+
+
+class CallAppsAccumulator:
+    def __init__(self):
+        self.app_calls = {}
+
+    def add(self, val):
+        app = val.app
+        call_type = val.type
+        if app and call_type in ("incoming", "outgoing"):
+            counts = self.app_calls.get(app)
+            if counts is None:
+                counts = self.app_calls[app] = {"incoming": 0, "outgoing": 0}
+            counts[call_type] += 1
+
+    def result(self):
+        return {"call_apps": {app: dict(counts) for app, counts in self.app_calls.items()}}
+
+
+class SpaceSaving:
+    """
+    Space-saving heavy hitters sketch with at most `capacity` counters. A key
+    that is not monitored replaces the smallest counter and inherits its count,
+    so counts are overestimates by at most that minimum, and they always add up
+    to the number of added keys. `payloads` keeps one value per monitored key.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self.payloads = {}
+        self.total = 0
+        # One (count, key) entry per monitored key; counts may be stale and are refreshed on eviction
+        self.heap = []
+
+    def _pop_minimum(self):
+        while True:
+            count, key = heapq.heappop(self.heap)
+            current = self.counts[key]
+            if current == count:
+                return count, key
+            heapq.heappush(self.heap, (current, key))
+
+    def add(self, key, payload=None):
+        self.total += 1
+        count = self.counts.get(key)
+        if count is not None:
+            self.counts[key] = count + 1
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = 1
+            heapq.heappush(self.heap, (1, key))
+        else:
+            minimum, evicted = self._pop_minimum()
+            del self.counts[evicted]
+            self.payloads.pop(evicted, None)
+            self.counts[key] = minimum + 1
+            heapq.heappush(self.heap, (minimum + 1, key))
+        if payload is not None:
+            self.payloads[key] = payload
+
+
+# Counters kept by the contact sketch (at least 10 per requested top contact)
+CONTACT_SKETCH_CAPACITY = int(os.environ.get("CONTACT_SKETCH_CAPACITY", 10000))
+
+
+class KeyContactsAccumulator:
+    """
+    Calls per contact ("<number> <name>"), most called first. With `top_k` only
+    the top contacts are returned (heap selection, same order as the full sort)
+    plus a key_contacts_others total; `sketch` counts approximately with a
+    bounded SpaceSaving sketch for histories with millions of distinct numbers.
+    """
+
+    def __init__(self, top_k=None, sketch=False):
+        self.top_k = top_k
+        self.sketch = SpaceSaving(max(CONTACT_SKETCH_CAPACITY, 10 * (top_k or 0))) if sketch else None
+        self.contact_calls = defaultdict(int)
+
+    def _count(self, contact, phone_number):
+        if self.sketch is not None:
+            self.sketch.add(contact, phone_number)
+        else:
+            self.contact_calls[contact] += 1
+
+    def add(self, val):
+        phone_number = val.number
+        if phone_number:
+            self._count(phone_number + ' ' + val.name, phone_number)
+
+    def result(self):
+        if self.sketch is None and self.top_k is None:
+            sorted_contacts = dict(sorted(self.contact_calls.items(), key=lambda x: x[1], reverse=True))
+            return {"key_contacts": sorted_contacts}
+
+        counts = self.contact_calls if self.sketch is None else self.sketch.counts
+        top_k = self.top_k if self.top_k is not None else len(counts)
+        top_contacts = dict(heapq.nlargest(top_k, counts.items(), key=lambda x: x[1]))
+        total = sum(counts.values()) if self.sketch is None else self.sketch.total
+        others = {
+            # The sketch does not know how many distinct contacts it dropped
+            "contacts": len(counts) - len(top_contacts) if self.sketch is None else None,
+            "calls": total - sum(top_contacts.values()),
+            "approximate": self.sketch is not None
+        }
+        return {"key_contacts": top_contacts, "key_contacts_others": others}
+
+
+class EnrichedKeyContactsAccumulator(KeyContactsAccumulator):
+    """key_contacts plus contact_details with subscriber and country data for each contact."""
+
+    def __init__(self, top_k=None, sketch=False):
+        super().__init__(top_k, sketch)
+        self.contact_numbers = {}
+
+    def _count(self, contact, phone_number):
+        super()._count(contact, phone_number)
+        if self.sketch is None:
+            self.contact_numbers[contact] = phone_number
+
+    def result(self):
+        result = super().result()
+        contact_numbers = self.contact_numbers if self.sketch is None else self.sketch.payloads
+        result["contact_details"] = contact_details(result["key_contacts"], contact_numbers)
+        return result
+
+
+class ActivityPeriodsAccumulator:
+    time_periods = {
+        'morning_calls': (6, 12),       # 6 AM to 12 PM
+        'afternoon_calls': (12, 18),    # 12 PM to 6 PM
+        'evening_calls': (18, 24),      # 6 PM to 12 AM
+        'night_calls': (0, 6)           # 12 AM to 6 AM
+    }
+
+    def __init__(self):
+        self.activity_counts = defaultdict(lambda: defaultdict(int))
+
+    def add(self, val):
+        timestamp = val.time
+        if timestamp:
+            day = timestamp.date()
+            hour = timestamp.hour
+            for period, (start_hour, end_hour) in self.time_periods.items():
+                if start_hour <= hour < end_hour or (start_hour == 0 and hour < end_hour):
+                    self.activity_counts[str(day)][period] += 1
+                    break
+
+    def result(self):
+        activity_counts = {
+            day: {
+                **periods,
+                'total_calls': sum(periods.values())
+            }
+            for day, periods in self.activity_counts.items()
+        }
+        sorted_activity = dict(sorted(activity_counts.items(), key=lambda x: x[1]['total_calls'], reverse=True))
+        return {"activity_periods": sorted_activity}
+
+
+class CountryActivityAccumulator:
+    def __init__(self):
+        self.country_index = get_country_index()
+        self.countries = {}
+        self.country_call_counts = defaultdict(int)
+
+    def add(self, call):
+        number = call.number
+        matched_country = self.countries.get(number)
+        if matched_country is None:
+            match = self.country_index.lookup(number)
+            matched_country = self.countries[number] = match[1] if match else 'Unknown'
+        self.country_call_counts[matched_country] += 1
+
+    def result(self):
+        return {"country_activity": dict(self.country_call_counts)}
+
+
+class CityActivityAccumulator:
+    def __init__(self):
+        self.cities = {}
+        self.city_call_counts = defaultdict(int)
+
+    def add(self, call):
+        if call.app != "unknown":
+            return
+        number = call.number
+        if number in self.cities:
+            matched_city = self.cities[number]
+        else:
+            matched_city = self.cities[number] = identify_city(number)
+        if matched_city:
+            self.city_call_counts[matched_city] += 1
+
+    def result(self):
+        return {"city_activity": dict(self.city_call_counts)}
+
+
+# Order defines the key order of the statistics_generator result
+DEFAULT_ACCUMULATORS = [
+    IncomingOutgoingAccumulator,
+    CallDurationAccumulator,
+    CallAppsAccumulator,
+    KeyContactsAccumulator,
+    ActivityPeriodsAccumulator,
+    CountryActivityAccumulator,
+    CityActivityAccumulator,
+]
+
+
+ENRICHED_ACCUMULATORS = [
+    EnrichedKeyContactsAccumulator if factory is KeyContactsAccumulator else factory
+    for factory in DEFAULT_ACCUMULATORS
+]
+
+
+def accumulator_factories(enrich=False, top_k=None, contact_sketch=False):
+    """DEFAULT/ENRICHED_ACCUMULATORS with the key contacts accumulator configured."""
+    factories = ENRICHED_ACCUMULATORS if enrich else DEFAULT_ACCUMULATORS
+    if top_k is None and not contact_sketch:
+        return factories
+    return [
+        partial(factory, top_k, contact_sketch) if issubclass(factory, KeyContactsAccumulator) else factory
+        for factory in factories
+    ]
+
+
+def aggregate(data, accumulators):
+    """
+    Feeds every call to every accumulator in a single pass over `data`
+    and merges the sections returned by each accumulator's result().
+    """
+    if detailed_timings():
+        _timed_pass(data, accumulators)
+    else:
+        adders = [accumulator.add for accumulator in accumulators]
+        for val in data:
+            for add in adders:
+                add(val)
+    return merge_results(accumulators)
+
+
+def _stage_name(accumulator):
+    return "statistics." + type(accumulator).__name__.removesuffix("Accumulator")
+
+
+def _timed_pass(data, accumulators):
+    """The aggregate() loop with the time of every accumulator's add() measured separately."""
+    clock = time.perf_counter
+    adders = [accumulator.add for accumulator in accumulators]
+    spent = [0.0] * len(adders)
+    start = clock()
+    for val in data:
+        for index, add in enumerate(adders):
+            before = clock()
+            add(val)
+            spent[index] += clock() - before
+    for accumulator, seconds in zip(accumulators, spent):
+        record(_stage_name(accumulator) + ".add", seconds)
+    # Whatever the loop spent outside the accumulators went into producing the (filtered) records;
+    # the predicate part of it is also recorded on its own as the "filter" stage
+    record("statistics.records", clock() - start - sum(spent))
+
+
+def merge_results(accumulators):
+    result = {}
+    for accumulator in accumulators:
+        start = time.perf_counter()
+        result.update(accumulator.result())
+        record(_stage_name(accumulator) + ".result", time.perf_counter() - start)
+    return result
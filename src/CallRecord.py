@@ -0,0 +1,88 @@
+from dateutil.parser import isoparse
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import NamedTuple, Optional
+import os
+import phonenumbers
+import re
+import sys
+
+_number_separators = re.compile(r'[\s\-().]')
+# Region used to read numbers written without a country code
+DEFAULT_PHONE_REGION = os.environ.get("DEFAULT_PHONE_REGION", "KZ")
+
+class CallRecord(NamedTuple):
+    """A call parsed once at ingest: interned strings, numeric duration, parsed timestamp."""
+    type: Optional[str]
+    app: Optional[str]
+    number: Optional[str]
+    normalized_number: Optional[str]
+    duration: float
+    timestamp: Optional[str]
+    time: Optional[datetime]
+    # `time` in seconds since the epoch (naive read as UTC), what every time range filter compares
+    epoch: Optional[float]
+    status: Optional[str]
+    name: Optional[str]
+
+def normalize_number(number):
+    """Drops separators and rewrites Kazakh 8XXXXXXXXXX / 7XXXXXXXXXX numbers to +7XXXXXXXXXX."""
+    if not number:
+        return number
+    number = _number_separators.sub('', number)
+    if len(number) == 11 and number.isdigit() and number[0] in '78':
+        return '+7' + number[1:]
+    return number
+
+@lru_cache(maxsize=1 << 16)
+def canonical_number(number):
+    """
+    E.164 form of a number (+77011234567 for 87011234567 or 7011234567 in KZ);
+    numbers phonenumbers cannot parse, or whose length is not possible for
+    their country (short codes, truncated numbers), fall back to normalize_number.
+    """
+    if not number:
+        return number
+    try:
+        parsed = phonenumbers.parse(number, DEFAULT_PHONE_REGION)
+    except phonenumbers.NumberParseException:
+        return normalize_number(number)
+    if not phonenumbers.is_possible_number(parsed):
+        return normalize_number(number)
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+def epoch_seconds(time):
+    """Seconds since the epoch of a datetime, naive ones read as UTC."""
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return time.timestamp()
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def to_record(call):
+    if isinstance(call, CallRecord):
+        return call
+    duration = call.get("duration")
+    if duration is None:
+        duration = 0
+    elif not isinstance(duration, (int, float)):
+        duration = float(duration)
+    timestamp = call.get("timestamp")
+    time = isoparse(timestamp) if timestamp else None
+    number = call.get("number")
+    return CallRecord(
+        type=_intern(call.get("type")),
+        app=_intern(call.get("app")),
+        number=number,
+        normalized_number=normalize_number(number),
+        duration=duration,
+        timestamp=timestamp,
+        time=time,
+        epoch=epoch_seconds(time) if time is not None else None,
+        status=_intern(call.get("status")),
+        name=call.get("name")
+    )
+
+def to_records(calls):
+    return [to_record(call) for call in calls]
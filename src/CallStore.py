@@ -0,0 +1,155 @@
+from dateutil.parser import isoparse
+from functools import lru_cache
+from src.CallRecord import epoch_seconds, to_record
+from src.Statistics import call_filter
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+# SQLite file holding the calls of every loaded case
+CALL_STORE_DB = os.environ.get("CALL_STORE_DB", "call_store.db")
+
+COLUMNS = ("type", "app", "number", "duration", "timestamp", "status", "name")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS calls (
+    case_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    type TEXT,
+    app TEXT,
+    number TEXT,
+    duration REAL,
+    timestamp TEXT,
+    epoch REAL,
+    status TEXT,
+    name TEXT,
+    PRIMARY KEY (case_id, seq)
+);
+CREATE INDEX IF NOT EXISTS calls_number ON calls (case_id, number);
+CREATE INDEX IF NOT EXISTS calls_type ON calls (case_id, type);
+CREATE INDEX IF NOT EXISTS calls_app ON calls (case_id, app);
+CREATE INDEX IF NOT EXISTS calls_epoch ON calls (case_id, epoch);
+"""
+
+def to_epoch(timestamp):
+    """Seconds since the epoch of an ISO timestamp, naive ones read as UTC."""
+    if not timestamp:
+        return None
+    return epoch_seconds(isoparse(timestamp))
+
+class CallStore:
+    """
+    Calls of uploaded cases in a SQLite file, indexed on number, type, app and
+    timestamp, so repeated filter combinations become index scans instead of
+    re-uploading and rescanning the whole history.
+    """
+
+    def __init__(self, path=CALL_STORE_DB):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+
+    def _insert_calls(self, case_id, count, calls):
+        rows = []
+        for call in calls:
+            rows.append((
+                case_id, count, call.get("type"), call.get("app"), call.get("number"), call.get("duration"),
+                call.get("timestamp"), to_epoch(call.get("timestamp")), call.get("status"), call.get("name")
+            ))
+            count += 1
+        self.connection.executemany(
+            "INSERT INTO calls (case_id, seq, type, app, number, duration, timestamp, epoch, status, name) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        self.connection.execute("UPDATE cases SET calls = ? WHERE id = ?", (count, case_id))
+        return count
+
+    def create_case(self, calls=()):
+        """Stores a new case with its calls in one transaction, returns the case id."""
+        case_id = uuid.uuid4().hex
+        with self.lock, self.connection:
+            self.connection.execute("INSERT INTO cases (id, created) VALUES (?, ?)", (case_id, time.time()))
+            self._insert_calls(case_id, 0, calls)
+        return case_id
+
+    def add_calls(self, case_id, calls):
+        """Appends calls to a case, returns the new call count or None for unknown cases."""
+        with self.lock, self.connection:
+            row = self.connection.execute("SELECT calls FROM cases WHERE id = ?", (case_id,)).fetchone()
+            if row is None:
+                return None
+            return self._insert_calls(case_id, row[0], calls)
+
+    def case_info(self, case_id):
+        with self.lock:
+            row = self.connection.execute("SELECT id, created, calls FROM cases WHERE id = ?", (case_id,)).fetchone()
+        if row is None:
+            return None
+        return {"case_id": row[0], "created": row[1], "calls": row[2]}
+
+    def delete_case(self, case_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM calls WHERE case_id = ?", (case_id,))
+            deleted = self.connection.execute("DELETE FROM cases WHERE id = ?", (case_id,)).rowcount
+        return bool(deleted)
+
+    @staticmethod
+    def _where(case_id, filters):
+        clauses = ["case_id = ?"]
+        parameters = [case_id]
+        filters = filters or {}
+        for field, column in (("phone_number", "number"), ("type", "type"), ("app", "app"), ("status", "status")):
+            if filters.get(field) is not None:
+                clauses.append(f"{column} = ?")
+                parameters.append(filters.get(field))
+        for field, column in (("phone_numbers", "number"), ("types", "type"), ("apps", "app")):
+            values = sorted(set(filters.get(field) or ()))
+            if values:
+                clauses.append(f"{column} IN ({','.join('?' * len(values))})")
+                parameters.extend(values)
+        # Calls without a duration are counted as 0 by the statistics
+        if filters.get("min_duration") is not None:
+            clauses.append("COALESCE(duration, 0) >= ?")
+            parameters.append(filters.get("min_duration"))
+        if filters.get("max_duration") is not None:
+            clauses.append("COALESCE(duration, 0) <= ?")
+            parameters.append(filters.get("max_duration"))
+        if filters.get("start_time"):
+            clauses.append("epoch >= ?")
+            parameters.append(to_epoch(filters.get("start_time")))
+        if filters.get("end_time"):
+            clauses.append("epoch <= ?")
+            parameters.append(to_epoch(filters.get("end_time")))
+        return " AND ".join(clauses), parameters
+
+    def iter_records(self, case_id, filters=None):
+        """
+        Yields the CallRecords of a case matching the filters dict, in upload order.
+        Each query runs on its own read-only connection, so concurrent readers do not wait on each other.
+        number_prefix also matches normalized numbers, so it is checked on the records.
+        """
+        where, parameters = self._where(case_id, filters)
+        prefix_filter = call_filter({"number_prefix": (filters or {}).get("number_prefix")})
+        connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            rows = connection.execute(f"SELECT {', '.join(COLUMNS)} FROM calls WHERE {where} ORDER BY seq", parameters)
+            records = (to_record(dict(zip(COLUMNS, row))) for row in rows)
+            yield from (records if prefix_filter is None else filter(prefix_filter, records))
+        finally:
+            connection.close()
+
+@lru_cache(maxsize=None)
+def load_call_store(path=CALL_STORE_DB):
+    """The call store, opened (and its file created) by the first request using a case."""
+    return CallStore(path)
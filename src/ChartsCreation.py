@@ -387,13 +387,23 @@
 
 
 
+from src.Metrics import stage
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import plotly.io as pio
+import heapq
+import html
+import io
+import os
 import re
+import tempfile
+import zipfile
 
-def chart_generation(stats, language='ru'):
+CHART_FORMATS = ('html', 'png', 'svg')
+
+def build_figures(stats, language='ru'):
+    """Builds the plotly figures for a statistics result, returns a list of (title, figure)."""
     translations = {
         'eng': {
             'bar_chart_title': 'Incoming vs Outgoing Calls (Bar Chart)',
@@ -572,10 +582,8 @@ def chart_generation(stats, language='ru'):
     # 4. Key Contacts (Horizontal Bar Chart)
     if len(stats['key_contacts']) != 0:
         contacts_data = stats['key_contacts']
-        sorted_contacts = sorted(contacts_data.items(), key=lambda x: x[1], reverse=True)
-        contacts, contact_counts = zip(*sorted_contacts)
-        top_contacts = contacts[:10]
-        top_counts = contact_counts[:10]
+        # Same order as a stable descending sort, without sorting every contact
+        top_contacts, top_counts = zip(*heapq.nlargest(10, contacts_data.items(), key=lambda x: x[1]))
         data = {
             text['yaxis_contacts']: top_contacts,
             text['xaxis_calls']: top_counts
@@ -667,13 +675,10 @@ def chart_generation(stats, language='ru'):
     if 'country_activity' in stats and len(stats['country_activity']) != 0:
         country_data = stats['country_activity']
         top_n = 10
-        sorted_countries = sorted(country_data.items(), key=lambda x: x[1], reverse=True)
-        if len(sorted_countries) > top_n:
-            top_countries = sorted_countries[:top_n]
-            others_total = sum(count for _, count in sorted_countries[top_n:])
+        top_countries = heapq.nlargest(top_n, country_data.items(), key=lambda x: x[1])
+        if len(country_data) > top_n:
+            others_total = sum(country_data.values()) - sum(count for _, count in top_countries)
             top_countries.append(('Others', others_total))
-        else:
-            top_countries = sorted_countries
 
         countries, counts = zip(*top_countries)
         data = {
@@ -696,13 +701,10 @@ def chart_generation(stats, language='ru'):
     if 'city_activity' in stats and len(stats['city_activity']) != 0:
         city_data = stats['city_activity']
         top_n = 10
-        sorted_cities = sorted(city_data.items(), key=lambda x: x[1], reverse=True)
-        if len(sorted_cities) > top_n:
-            top_cities = sorted_cities[:top_n]
-            others_total = sum(count for _, count in sorted_cities[top_n:])
+        top_cities = heapq.nlargest(top_n, city_data.items(), key=lambda x: x[1])
+        if len(city_data) > top_n:
+            others_total = sum(city_data.values()) - sum(count for _, count in top_cities)
             top_cities.append(('Others', others_total))
-        else:
-            top_cities = sorted_cities
 
         cities, counts = zip(*top_cities)
         data = {
@@ -721,13 +723,70 @@ def chart_generation(stats, language='ru'):
         figures.append(fig11)
         titles.append(text['city_donut_title'])
 
-    # Save each figure as a PNG file
-    for fig, title in zip(figures, titles):
-        # Sanitize the title to create a filename
-        filename = re.sub(r'[^\w\s-]', '', title)  # Remove special characters
-        filename = filename.replace(' ', '_')       # Replace spaces with underscores
-        filename = filename.lower()                 # Convert to lowercase
-        filename = f"{filename}.png"
-        # Save the figure as a PNG file
-        fig.show()
+    return list(zip(titles, figures))
+
+def chart_filename(title, extension):
+    # Sanitize the title to create a filename
+    filename = re.sub(r'[^\w\s-]', '', title)  # Remove special characters
+    filename = filename.replace(' ', '_')       # Replace spaces with underscores
+    filename = filename.lower()                 # Convert to lowercase
+    return f"{filename}.{extension}"
+
+def _html_bundle(figures):
+    # One self-contained page: plotly.js is inlined with the first figure only
+    parts = []
+    for index, (title, fig) in enumerate(figures):
+        parts.append(f"<h2>{html.escape(title)}</h2>")
+        parts.append(fig.to_html(full_html=False, include_plotlyjs=(index == 0)))
+    page = (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Call history charts</title></head><body>'
+        + ''.join(parts) + '</body></html>'
+    )
+    return {'charts.html': page.encode('utf-8')}
+
+def _static_images(figures, chart_format):
+    if hasattr(pio, 'write_images'):
+        # Newer plotly renders the whole batch in a single kaleido session
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, chart_filename(title, chart_format)) for title, _ in figures]
+            pio.write_images([fig for _, fig in figures], paths, format=chart_format)
+            images = {}
+            for path in paths:
+                with open(path, 'rb') as file:
+                    images[os.path.basename(path)] = file.read()
+            return images
+    # Older kaleido keeps one renderer process alive between to_image calls
+    return {chart_filename(title, chart_format): pio.to_image(fig, format=chart_format) for title, fig in figures}
+
+def export_charts(stats, language='ru', chart_format='html', directory=None):
+    """
+    Renders every chart of a statistics result in one batch and returns the
+    files as a zip archive (bytes). 'html' produces a single page, 'png' and
+    'svg' one image per chart. If `directory` is given the files are also
+    written there.
+    """
+    if chart_format not in CHART_FORMATS:
+        raise ValueError(f"Unsupported chart format: {chart_format}")
+    with stage("charts.build"):
+        figures = build_figures(stats, language)
+    with stage(f"charts.export.{chart_format}"):
+        if chart_format == 'html':
+            files = _html_bundle(figures)
+        else:
+            files = _static_images(figures, chart_format) if figures else {}
+
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        for filename, content in files.items():
+            with open(os.path.join(directory, filename), 'wb') as file:
+                file.write(content)
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for filename, content in files.items():
+            bundle.writestr(filename, content)
+    return archive.getvalue()
 
+def chart_generation(stats, language='ru'):
+    for title, fig in build_figures(stats, language):
+        fig.show()
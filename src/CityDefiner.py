@@ -0,0 +1,38 @@
+from src.PrefixIndex import PrefixIndex
+from functools import lru_cache
+import json
+
+@lru_cache(maxsize=None)
+def get_city_index():
+    with open('city_codes.json', 'r', encoding='utf-8') as file:
+        cities = json.load(file)
+    city_code_map = {}
+    for city, code in cities.items():
+        city_code_map[code] = city
+    return PrefixIndex(city_code_map)
+
+def local_number(phone_number):
+    """Strips the Kazakh +7 / 8 trunk prefix, returns None for other numbers."""
+    if phone_number.startswith('+7'):
+        return phone_number[2:]
+    if phone_number.startswith('8'):
+        return phone_number[1:]
+    return None
+
+def identify_city(phone_number):
+    """Returns the city of a Kazakh landline, 'mobile_call' for other +7/8 numbers and None otherwise."""
+    number = local_number(phone_number)
+    if number is None:
+        return None
+    match = get_city_index().lookup(number)
+    return match[1] if match else 'mobile_call'
+
+def identify_cities(phone_numbers):
+    """Batch variant of identify_city, resolves each distinct number once."""
+    resolved = {}
+    result = []
+    for phone_number in phone_numbers:
+        if phone_number not in resolved:
+            resolved[phone_number] = identify_city(phone_number)
+        result.append(resolved[phone_number])
+    return result
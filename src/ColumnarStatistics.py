@@ -0,0 +1,255 @@
+from dateutil.parser import isoparse
+import numpy as np
+import pandas as pd
+from src.CallRecord import CallRecord, epoch_seconds, normalize_number
+from src.CountryDefiner import get_country_index
+from src.CityDefiner import identify_cities
+from src.Enrichment import contact_details
+from src.Metrics import stage
+from src.Statistics import FILTER_VALUES
+
+# Hour of day -> activity period, same buckets as ActivityPeriodsAccumulator
+HOUR_PERIODS = np.array(
+    ['night_calls'] * 6 + ['morning_calls'] * 6 + ['afternoon_calls'] * 6 + ['evening_calls'] * 6,
+    dtype=object
+)
+
+
+CALL_FIELDS = ("type", "app", "number", "duration", "timestamp", "status", "name")
+
+# Wall-clock prefix (date and time before any fraction or zone) of an extended ISO timestamp
+WALL_CLOCK_FORMAT = '%Y-%m-%dT%H:%M:%S'
+EPOCH = pd.Timestamp(0).as_unit('us')
+
+
+def _duration(duration):
+    # Same conversion as to_record: missing durations count as 0
+    if duration is None or duration != duration:
+        return 0
+    return duration if isinstance(duration, (int, float)) else float(duration)
+
+
+def _parse_times(timestamps):
+    """
+    Epoch seconds (naive timestamps read as UTC, like epoch_seconds) and wall-clock
+    datetimes (what the activity periods count) of a timestamp column, each parsed
+    by one vectorized pd.to_datetime call. Values pandas cannot read go through
+    isoparse, which raises on invalid timestamps like to_record does.
+    """
+    present = timestamps.notna() & (timestamps != '')
+    text = timestamps[present].astype(str)
+    utc = pd.to_datetime(text, utc=True, format='ISO8601', errors='coerce')
+    # Any other layout fails the strict format and is read by isoparse below
+    wall = pd.to_datetime(text.str.slice(0, 19), format=WALL_CLOCK_FORMAT, errors='coerce')
+    # Whole microseconds are exact in a float, so this matches datetime.timestamp()
+    microseconds = (utc.dt.tz_convert(None).astype('datetime64[us]') - EPOCH) / pd.Timedelta(microseconds=1)
+    epoch = microseconds / 10 ** 6
+    failed = text.index[utc.isna().to_numpy() | wall.isna().to_numpy()]
+    if len(failed):
+        times = [isoparse(text[index]) for index in failed]
+        epoch[failed] = [epoch_seconds(time) for time in times]
+        wall[failed] = [time.replace(tzinfo=None) for time in times]
+    return epoch.reindex(timestamps.index), wall.reindex(timestamps.index)
+
+
+def build_frame(calls):
+    """
+    One column per call field straight from the raw call dicts (or CallRecords),
+    plus 'epoch' and 'time' (wall clock) parsed from the timestamps.
+    """
+    calls = list(calls)
+    if calls and isinstance(calls[0], CallRecord):
+        frame = pd.DataFrame.from_records(calls, columns=CallRecord._fields).loc[:, list(CALL_FIELDS)]
+    else:
+        frame = pd.DataFrame.from_records(calls, columns=CALL_FIELDS, coerce_float=False)
+    durations = frame['duration']
+    if durations.dtype == object or durations.isna().any():
+        frame['duration'] = pd.Series([_duration(duration) for duration in durations], index=frame.index)
+    frame['epoch'], frame['time'] = _parse_times(frame['timestamp'])
+    return frame
+
+
+def _prefix_mask(numbers, prefix):
+    """number_prefix on the raw or normalized number, checked once per distinct number."""
+    def resolve(uniques):
+        return [
+            (number or '').startswith(prefix) or (normalize_number(number) or '').startswith(prefix)
+            for number in uniques
+        ]
+    return _resolve_distinct(numbers, resolve, False).astype(bool)
+
+
+def filter_frame(frame, filters):
+    """The clauses of call_filter as boolean masks over the frame."""
+    if not filters:
+        return frame
+    mask = pd.Series(True, index=frame.index)
+    for key, column in (("type", "type"), ("app", "app"), ("status", "status"), ("phone_number", "number")):
+        if filters.get(key) is not None:
+            mask &= frame[column] == filters[key]
+    for key, column in (("types", "type"), ("apps", "app"), ("phone_numbers", "number")):
+        if filters.get(key):
+            mask &= frame[column].isin(FILTER_VALUES[key](filters[key]))
+    if filters.get("min_duration") is not None:
+        mask &= frame['duration'] >= filters["min_duration"]
+    if filters.get("max_duration") is not None:
+        mask &= frame['duration'] <= filters["max_duration"]
+    if filters.get("number_prefix"):
+        mask &= _prefix_mask(frame['number'], filters["number_prefix"])
+    for key, compare in (("start_time", frame['epoch'].ge), ("end_time", frame['epoch'].le)):
+        bound = FILTER_VALUES[key](filters.get(key))
+        if bound is not None:
+            mask &= compare(bound).fillna(False)
+    return frame[mask]
+
+
+def _item(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+def _counts_in_order(values):
+    """Value counts keyed in order of first appearance, like a defaultdict(int) fill."""
+    return {key: int(count) for key, count in values.groupby(values, sort=False).size().items()}
+
+
+def _resolve_distinct(numbers, resolve, missing):
+    """Resolves each distinct number once and broadcasts the answers back to the column."""
+    codes, uniques = pd.factorize(numbers)
+    resolved = np.array(list(resolve(list(uniques))) + [missing], dtype=object)
+    return pd.Series(resolved[codes], index=numbers.index)
+
+
+def get_incoming_outgoing_calls(frame):
+    type_counts = frame['type'].value_counts()
+    return int(type_counts.get('incoming', 0)), int(type_counts.get('outgoing', 0))
+
+
+def get_call_duration_statistics(frame, incoming_calls, outgoing_calls):
+    def section(durations, amount):
+        if durations.empty:
+            return {'amount': amount, 'average_duration': 0, 'max_duration': float('-inf'), 'min_duration': 0}
+        return {
+            'amount': amount,
+            'average_duration': round(_item(durations.sum()) / amount, 1),
+            'max_duration': _item(durations.max()),
+            'min_duration': _item(durations.min())
+        }
+
+    durations = frame['duration']
+    return {
+        'total_calls': section(durations, len(frame)),
+        'incoming_calls': section(durations[frame['type'] == 'incoming'], incoming_calls),
+        'outgoing_calls': section(durations[frame['type'] == 'outgoing'], outgoing_calls)
+    }
+
+
+def get_call_apps(frame):
+    calls = frame[frame['app'].notna() & (frame['app'] != '') & frame['type'].isin(['incoming', 'outgoing'])]
+    if calls.empty:
+        return {}
+    table = pd.crosstab(calls['app'], calls['type']).reindex(
+        index=calls['app'].unique(), columns=['incoming', 'outgoing'], fill_value=0
+    )
+    return {
+        app: {'incoming': int(row['incoming']), 'outgoing': int(row['outgoing'])}
+        for app, row in table.iterrows()
+    }
+
+
+def _contacts(frame):
+    calls = frame[frame['number'].notna() & (frame['number'] != '')]
+    return calls['number'], calls['number'] + ' ' + calls['name']
+
+
+def get_key_contacts(frame, top_k=None):
+    _, contacts = _contacts(frame)
+    counts = pd.Series(_counts_in_order(contacts))
+    if counts.empty:
+        return {}
+    if top_k is not None:
+        # nlargest keeps the first of equal counts, like the stable sort below
+        counts = counts.nlargest(top_k, keep='first')
+    counts = counts.sort_values(ascending=False, kind='stable')
+    return {contact: int(count) for contact, count in counts.items()}
+
+
+def get_key_contacts_others(frame, key_contacts):
+    _, contacts = _contacts(frame)
+    return {
+        "contacts": int(contacts.nunique(dropna=False)) - len(key_contacts),
+        "calls": len(contacts) - sum(key_contacts.values()),
+        "approximate": False
+    }
+
+
+def get_contact_details(frame, key_contacts):
+    numbers, contacts = _contacts(frame)
+    contact_numbers = dict(zip(contacts, numbers))
+    return contact_details(key_contacts, contact_numbers)
+
+
+def get_most_active_periods(frame):
+    times = frame['time'].dropna()
+    days = times.dt.strftime('%Y-%m-%d')
+    hours = times.dt.hour.to_numpy()
+    buckets = pd.DataFrame({'day': days, 'period': HOUR_PERIODS[hours]})
+
+    activity_counts = {}
+    for (day, period), count in buckets.groupby(['day', 'period'], sort=False).size().items():
+        activity_counts.setdefault(day, {})[period] = int(count)
+    for periods in activity_counts.values():
+        periods['total_calls'] = sum(periods.values())
+    return dict(sorted(activity_counts.items(), key=lambda x: x[1]['total_calls'], reverse=True))
+
+
+def get_key_countries(frame):
+    country_index = get_country_index()
+
+    def resolve(numbers):
+        return [
+            match[1] if match else 'Unknown'
+            for match in country_index.lookup_many(numbers)
+        ]
+
+    return _counts_in_order(_resolve_distinct(frame['number'], resolve, 'Unknown'))
+
+
+def get_key_cities(frame):
+    calls = frame[frame['app'] == 'unknown']
+    cities = _resolve_distinct(calls['number'], identify_cities, None)
+    return _counts_in_order(cities.dropna())
+
+
+def columnar_statistics(calls, filters=None, enrich=False, top_k=None):
+    """
+    Vectorized counterpart of the accumulator pipeline. Takes raw call dicts
+    (or CallRecords) and the filters dict and returns the same dict as statistics_generator.
+    """
+    frame = build_frame(calls)
+    with stage("filter"):
+        frame = filter_frame(frame, filters)
+    incoming, outgoing = get_incoming_outgoing_calls(frame)
+    if frame.empty:
+        call_duration = {
+            section: {'amount': 0, 'average_duration': 0, 'max_duration': 0, 'min_duration': 0}
+            for section in ('total_calls', 'incoming_calls', 'outgoing_calls')
+        }
+    else:
+        call_duration = get_call_duration_statistics(frame, incoming, outgoing)
+
+    key_contacts = get_key_contacts(frame, top_k)
+    result = {
+        "incoming": incoming,
+        "outgoing": outgoing,
+        "call_duration": call_duration,
+        "call_apps": get_call_apps(frame),
+        "key_contacts": key_contacts,
+    }
+    if top_k is not None:
+        result["key_contacts_others"] = get_key_contacts_others(frame, key_contacts)
+    if enrich:
+        result["contact_details"] = get_contact_details(frame, key_contacts)
+    result["activity_periods"] = get_most_active_periods(frame)
+    result["country_activity"] = get_key_countries(frame)
+    result["city_activity"] = get_key_cities(frame)
+    return result
@@ -1,11 +1,28 @@
+from src.PrefixIndex import PrefixIndex
+from functools import lru_cache
 import json
 
-def identify_country_by_prefix(phone_number):
+@lru_cache(maxsize=None)
+def get_country_index():
     with open('country_codes.json', 'r', encoding='utf-8') as file:
         country_prefixes = json.load(file)
+    country_code_map = {}
     for country, prefixes in country_prefixes.items():
         for prefix in prefixes:
-            if phone_number.startswith(prefix):
-                return country, prefix
-    print("Неизвестный код страны")
-    return None
\ No newline at end of file
+            country_code_map[prefix] = country
+    return PrefixIndex(country_code_map)
+
+def identify_country_by_prefix(phone_number):
+    match = get_country_index().lookup(phone_number)
+    if match is None:
+        print("Неизвестный код страны")
+        return None
+    prefix, country = match
+    return country, prefix
+
+def identify_countries(phone_numbers):
+    """Batch variant of identify_country_by_prefix: a list of (country, prefix) or None."""
+    return [
+        (match[1], match[0]) if match else None
+        for match in get_country_index().lookup_many(phone_numbers)
+    ]
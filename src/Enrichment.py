@@ -0,0 +1,32 @@
+from src.FindAbonnent import load_subscriber_store
+from src.CountryDefiner import identify_countries
+
+def enrich_numbers(phone_numbers):
+    """
+    Resolves subscriber identity and country of every distinct number in one
+    bulk lookup. Returns {phone_number: {id, firstName, lastName, country, prefix}}.
+    """
+    distinct = list(dict.fromkeys(number for number in phone_numbers if number))
+    subscribers = load_subscriber_store().get_many(distinct)
+    details = {}
+    for number, country in zip(distinct, identify_countries(distinct)):
+        abonnent = subscribers.get(number) or {}
+        details[number] = {
+            "id": abonnent.get("id"),
+            "firstName": abonnent.get("firstName"),
+            "lastName": abonnent.get("lastName"),
+            "country": country[0] if country else None,
+            "prefix": country[1] if country else None,
+        }
+    return details
+
+def contact_details(key_contacts, contact_numbers):
+    """
+    Joins the enriched numbers onto key_contacts: same keys and order, each
+    mapped to its number, call count and subscriber/country fields.
+    """
+    details = enrich_numbers(contact_numbers[contact] for contact in key_contacts)
+    return {
+        contact: {"number": contact_numbers[contact], "calls": calls, **details[contact_numbers[contact]]}
+        for contact, calls in key_contacts.items()
+    }
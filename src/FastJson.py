@@ -0,0 +1,77 @@
+from fastapi import Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+from src.Metrics import stage
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib encoder is the fallback
+    orjson = None
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(value):
+        """Compact UTF-8 JSON bytes; non-finite floats are written as null."""
+        return orjson.dumps(value, option=_OPTIONS)
+
+    def canonical_dumps(value):
+        """Like dumps with sorted keys; values JSON cannot represent are written as str()."""
+        return orjson.dumps(value, default=str, option=_OPTIONS | orjson.OPT_SORT_KEYS)
+
+    loads = orjson.loads
+else:
+    def dumps(value):
+        """Compact UTF-8 JSON bytes; non-finite floats raise ValueError like starlette's JSONResponse."""
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'), allow_nan=False).encode('utf-8')
+
+    def canonical_dumps(value):
+        """Like dumps with sorted keys; values JSON cannot represent are written as str()."""
+        return json.dumps(value, ensure_ascii=False, separators=(',', ':'), sort_keys=True, default=str).encode('utf-8')
+
+    loads = json.loads
+
+class FastJSONResponse(Response):
+    """
+    JSON response encoded with orjson when it is installed. Endpoints return it
+    directly with plain dicts/lists, which skips FastAPI's jsonable_encoder pass.
+    """
+    media_type = "application/json"
+
+    def render(self, content):
+        with stage("serialization"):
+            return dumps(content)
+
+def json_body(model):
+    """
+    Dependency validating the raw request body straight into `model` with
+    pydantic's JSON parser, instead of json.loads followed by validation.
+    Validation errors are reported like FastAPI's own body validation (422).
+    """
+    async def parse(request: Request):
+        body = await request.body()
+        try:
+            with stage("validation"):
+                return model.model_validate_json(body)
+        except ValidationError as e:
+            errors = [{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)]
+            raise RequestValidationError(errors, body=body)
+    return parse
+
+def _inline_refs(schema, defs):
+    if isinstance(schema, dict):
+        if "$ref" in schema:
+            return _inline_refs(defs[schema["$ref"].rsplit('/', 1)[-1]], defs)
+        return {key: _inline_refs(value, defs) for key, value in schema.items() if key != "$defs"}
+    if isinstance(schema, list):
+        return [_inline_refs(value, defs) for value in schema]
+    return schema
+
+def json_body_schema(model):
+    """openapi_extra documenting a body parsed by json_body(model), nested models inlined."""
+    schema = model.model_json_schema()
+    return {"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _inline_refs(schema, schema.get("$defs", {}))}}
+    }}
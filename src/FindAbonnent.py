@@ -1,5 +1,98 @@
-def find_abonnent(data, abonnent):
-    for val in data:
-        if val.get("phoneNumber", None) == abonnent:
-            return val
-    print("Номер не найден в базе данных оператора")
\ No newline at end of file
+from src.CallRecord import normalize_number
+from functools import lru_cache
+import json
+import os
+import sqlite3
+import threading
+
+# JSON operator dump ({"abonnents": [...]}) or a SQLite file built with build_sqlite_store
+SUBSCRIBER_DB = os.environ.get("SUBSCRIBER_DB", "test_operator_database.json")
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+class MemorySubscriberStore:
+    """Operator subscribers held in a dict keyed by normalized phone number."""
+
+    def __init__(self, abonnents):
+        self.index = {}
+        for abonnent in abonnents:
+            self.index.setdefault(normalize_number(abonnent.get("phoneNumber")), abonnent)
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path, 'r', encoding='utf-8') as file:
+            return cls(json.load(file)["abonnents"])
+
+    def get(self, phone_number):
+        return self.index.get(normalize_number(phone_number))
+
+    def get_many(self, phone_numbers):
+        """Returns {phone_number: abonnent} for the numbers found in the store."""
+        result = {}
+        for phone_number in set(phone_numbers):
+            abonnent = self.get(phone_number)
+            if abonnent is not None:
+                result[phone_number] = abonnent
+        return result
+
+class SqliteSubscriberStore:
+    """Operator subscribers in a SQLite file, looked up through the phone number primary key."""
+
+    # Stays below SQLite's default limit of bound parameters per statement
+    batch_size = 500
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def get(self, phone_number):
+        return self.get_many([phone_number]).get(phone_number)
+
+    def get_many(self, phone_numbers):
+        """Returns {phone_number: abonnent} for the numbers found in the store."""
+        by_normalized = {}
+        for phone_number in set(phone_numbers):
+            by_normalized.setdefault(normalize_number(phone_number), []).append(phone_number)
+        keys = [key for key in by_normalized if key]
+        result = {}
+        with self.lock:
+            for start in range(0, len(keys), self.batch_size):
+                batch = keys[start:start + self.batch_size]
+                rows = self.connection.execute(
+                    f"SELECT phone_number, data FROM abonnents WHERE phone_number IN ({','.join('?' * len(batch))})",
+                    batch
+                )
+                for key, data in rows:
+                    abonnent = json.loads(data)
+                    for phone_number in by_normalized[key]:
+                        result[phone_number] = abonnent
+        return result
+
+def build_sqlite_store(json_path, db_path):
+    """Converts a JSON operator dump into an indexed SQLite subscriber store."""
+    with open(json_path, 'r', encoding='utf-8') as file:
+        abonnents = json.load(file)["abonnents"]
+    connection = sqlite3.connect(db_path)
+    with connection:
+        connection.execute("DROP TABLE IF EXISTS abonnents")
+        connection.execute("CREATE TABLE abonnents (phone_number TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        connection.executemany(
+            "INSERT OR IGNORE INTO abonnents (phone_number, data) VALUES (?, ?)",
+            (
+                (normalize_number(abonnent.get("phoneNumber")), json.dumps(abonnent, ensure_ascii=False))
+                for abonnent in abonnents
+            )
+        )
+    connection.close()
+
+@lru_cache(maxsize=None)
+def load_subscriber_store(path=SUBSCRIBER_DB):
+    if path.endswith(SQLITE_EXTENSIONS):
+        return SqliteSubscriberStore(path)
+    return MemorySubscriberStore.from_json(path)
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3:
+        print("Usage: python -m src.FindAbonnent <operator_database.json> <subscribers.db>")
+        sys.exit(1)
+    build_sqlite_store(sys.argv[1], sys.argv[2])
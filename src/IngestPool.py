@@ -0,0 +1,55 @@
+from concurrent.futures import ProcessPoolExecutor
+from src.StreamingJson import iter_json_array
+from xml_converter import iter_calls
+import os
+import shutil
+import tempfile
+import threading
+
+# Decoding uploads is CPU-bound, so each source file is parsed in its own worker process
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", os.cpu_count() or 1))
+
+_executor = None
+_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=INGEST_WORKERS)
+        return _executor
+
+def is_xml_upload(filename):
+    return (filename or "").lower().endswith(('.xml', '.xml.gz'))
+
+def iter_source(file, filename):
+    """
+    Calls of one uploaded source, decoded incrementally from a binary file.
+    Raises KeyError if a JSON source has no 'call_history' array.
+    """
+    if is_xml_upload(filename):
+        return iter_calls(file)
+    return iter_json_array(file, "call_history")
+
+def load_source(path, filename):
+    """Worker side: decodes one spooled source into its list of calls."""
+    with open(path, 'rb') as file:
+        return list(iter_source(file, filename))
+
+def spool_to_disk(file):
+    """Copies an upload to a named temporary file the workers can open, returns its path."""
+    file.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False) as spooled:
+        shutil.copyfileobj(file, spooled)
+    file.seek(0)
+    return spooled.name
+
+def submit_source(path, filename):
+    return get_executor().submit(load_source, path, filename)
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
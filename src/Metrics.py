@@ -0,0 +1,119 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import cProfile
+import os
+import re
+import threading
+import time
+
+# Upper bounds (seconds) of the histogram buckets exported on /metrics
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Fraction of requests whose profiled stages are captured with cProfile, and where the .prof files go
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+# Characters not allowed in Server-Timing metric names and profile file names
+_unsafe_name = re.compile(r'[^\w.-]')
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, rendered in the Prometheus text format."""
+
+    def __init__(self, name, description, label_names):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.series = {}  # label values -> [bucket counts, sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * len(BUCKETS), 0.0, 0]
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted(self.series.items())
+            for labels, (buckets, total, count) in items:
+                label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+                for bound, bucket in zip(BUCKETS, buckets):
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {bucket}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {total}")
+                lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return "\n".join(lines)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+stage_seconds = Histogram("callstats_stage_seconds", "Time spent per pipeline stage.", ("stage",))
+request_seconds = Histogram("callstats_request_seconds", "Total request time.", ("method", "path", "status"))
+
+# Stage timings of the current request ({stage: seconds}), None outside of collect_timings
+_timings = ContextVar("timings", default=None)
+# Whether the current request asked for fine-grained (per accumulator) stages
+_detailed = ContextVar("detailed", default=False)
+# Whether the current request has been sampled for profiling
+_profiling = ContextVar("profiling", default=False)
+
+@contextmanager
+def collect_timings(detailed=False, profile=False):
+    """
+    Collects the stage timings of everything run inside the block, including
+    threads started from it with run_in_threadpool (they copy the context).
+    """
+    timings = {}
+    tokens = (_timings.set(timings), _detailed.set(detailed), _profiling.set(profile))
+    try:
+        yield timings
+    finally:
+        for variable, token in zip((_timings, _detailed, _profiling), tokens):
+            variable.reset(token)
+
+def detailed_timings():
+    """True when the current request asked for fine-grained stages, which cost time to measure."""
+    return _detailed.get()
+
+def record(name, seconds):
+    stage_seconds.observe((name,), seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+def record_all(timings):
+    for name, seconds in timings.items():
+        record(name, seconds)
+
+@contextmanager
+def stage(name, profile=False):
+    """
+    Times the block as `name`. With `profile`, requests sampled for profiling
+    also run the block under cProfile and write PROFILE_DIR/<name>-<time>.prof.
+    """
+    profiler = cProfile.Profile() if profile and _profiling.get() else None
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        record(name, time.perf_counter() - start)
+        if profiler is not None:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            filename = _unsafe_name.sub('_', f"{name}-{time.time():.6f}.prof")
+            profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+
+def server_timing(timings):
+    """Server-Timing header value, durations in milliseconds."""
+    return ", ".join(f"{_unsafe_name.sub('_', name)};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
+
+def render_metrics():
+    return "\n".join([stage_seconds.render(), request_seconds.render()]) + "\n"
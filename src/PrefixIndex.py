@@ -0,0 +1,38 @@
+class PrefixIndex:
+    """
+    Longest-prefix-match index over a {prefix: value} map.
+
+    Prefixes are bucketed by length, so a lookup costs one dict probe per
+    distinct prefix length (longest first) instead of a scan over every prefix.
+    """
+
+    def __init__(self, prefix_map):
+        self.prefix_map = dict(prefix_map)
+        self.lengths = sorted({len(prefix) for prefix in self.prefix_map}, reverse=True)
+
+    def __len__(self):
+        return len(self.prefix_map)
+
+    def lookup(self, number):
+        """Returns (prefix, value) for the longest matching prefix or None."""
+        if not number:
+            return None
+        prefix_map = self.prefix_map
+        for length in self.lengths:
+            prefix = number[:length]
+            if prefix in prefix_map:
+                return prefix, prefix_map[prefix]
+        return None
+
+    def lookup_many(self, numbers):
+        """
+        Resolves a whole list of numbers at once, looking each distinct
+        number up only once. Returns a list aligned with `numbers`.
+        """
+        resolved = {}
+        result = []
+        for number in numbers:
+            if number not in resolved:
+                resolved[number] = self.lookup(number)
+            result.append(resolved[number])
+        return result
@@ -0,0 +1,68 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from src.ChartsCreation import export_charts
+from src.Metrics import collect_timings, record_all
+import os
+import threading
+import uuid
+
+# Plotly figure building is CPU-bound Python, so charts are rendered in worker processes
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", 2))
+# Finished jobs are kept until this many newer jobs have been submitted
+MAX_RENDER_JOBS = int(os.environ.get("MAX_RENDER_JOBS", 256))
+
+_executor = None
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        return _executor
+
+def render(stats, language, chart_format):
+    """Worker side: the zipped charts plus the chart stage timings, which are recorded by the parent process."""
+    with collect_timings() as timings:
+        charts = export_charts(stats, language, chart_format)
+    return charts, timings
+
+def _record_timings(future):
+    if not future.cancelled() and future.exception() is None:
+        record_all(future.result()[1])
+
+def submit_render(stats, language='ru', chart_format='html'):
+    """Queues the chart export of a statistics result and returns the job id."""
+    future = get_executor().submit(render, stats, language or 'ru', chart_format or 'html')
+    future.add_done_callback(_record_timings)
+    job_id = uuid.uuid4().hex
+    with _lock:
+        _jobs[job_id] = future
+        while len(_jobs) > MAX_RENDER_JOBS:
+            _, evicted = _jobs.popitem(last=False)
+            evicted.cancel()
+    return job_id
+
+def get_render_job(job_id):
+    """Returns {"status": ...} for a job, with the zipped charts once done, or None for unknown ids."""
+    with _lock:
+        future = _jobs.get(job_id)
+    if future is None:
+        return None
+    if not future.done():
+        return {"status": "pending"}
+    if future.cancelled():
+        return {"status": "cancelled"}
+    error = future.exception()
+    if error is not None:
+        return {"status": "failed", "error": str(error)}
+    return {"status": "done", "charts": future.result()[0]}
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+        _jobs.clear()
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
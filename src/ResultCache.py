@@ -0,0 +1,170 @@
+from collections import OrderedDict
+from src.FastJson import canonical_dumps, dumps, loads
+from src.Metrics import stage
+import hashlib
+import os
+import threading
+import time
+
+def canonical_hash(payload):
+    """SHA-256 of the canonical JSON form of a payload (sorted keys, no whitespace)."""
+    with stage("hash"):
+        return hashlib.sha256(canonical_dumps(payload)).hexdigest()
+
+def file_hash(file):
+    """SHA-256 of an open binary file, read in blocks; the file is rewound afterwards."""
+    sha256_hash = hashlib.sha256()
+    file.seek(0)
+    for byte_block in iter(lambda: file.read(1 << 16), b""):
+        sha256_hash.update(byte_block)
+    file.seek(0)
+    return sha256_hash.hexdigest()
+
+class ResultCache:
+    """
+    LRU + TTL cache of JSON-serializable results keyed by a content hash.
+
+    The memory tier is bounded by the total size of the cached results in
+    serialized form; the optional disk tier keeps one <key>.json per entry.
+    The disk tier is swept on set(), at most every `sweep_interval` seconds:
+    expired files are removed, then the oldest ones until the directory is
+    within `max_disk_bytes`.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, ttl=3600, directory=None,
+                 max_disk_bytes=1024 * 1024 * 1024, sweep_interval=60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.sweep_interval = sweep_interval
+        self.next_sweep = 0
+        self.entries = OrderedDict()  # key -> (expires_at, size, value)
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _evict(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.size -= size
+
+    def _store(self, key, value, size, expires_at):
+        if key in self.entries:
+            self._evict(key)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (expires_at, size, value)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._evict(next(iter(self.entries)))
+
+    def _load_from_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            expires_at = os.path.getmtime(path) + self.ttl
+            if expires_at < time.time():
+                os.remove(path)
+                return None
+            with open(path, 'rb') as file:
+                serialized = file.read()
+        except OSError:
+            return None
+        value = loads(serialized)
+        with self.lock:
+            self._store(key, value, len(serialized), expires_at)
+        return value
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, _, value = entry
+                if expires_at >= time.time():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._evict(key)
+        value = self._load_from_disk(key) if self.directory else None
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+        return value
+
+    def _sweep_disk(self, now):
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            if stat.st_mtime + self.ttl < now:
+                self._remove_file(entry.path)
+            else:
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        disk_size = sum(size for _, size, _ in files)
+        files.sort()
+        for _, size, path in files:
+            if disk_size <= self.max_disk_bytes:
+                break
+            self._remove_file(path)
+            disk_size -= size
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def set(self, key, value):
+        serialized = dumps(value)
+        now = time.time()
+        with self.lock:
+            self._store(key, value, len(serialized), now + self.ttl)
+            sweep = self.directory and now >= self.next_sweep
+            if sweep:
+                self.next_sweep = now + self.sweep_interval
+        if self.directory:
+            path = self._disk_path(key)
+            with open(path + '.tmp', 'wb') as file:
+                file.write(serialized)
+            os.replace(path + '.tmp', path)
+            if sweep:
+                self._sweep_disk(now)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "size_bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk_directory": self.directory,
+                "max_disk_bytes": self.max_disk_bytes,
+            }
+
+result_cache = ResultCache(
+    max_bytes=int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+    ttl=int(os.environ.get("RESULT_CACHE_TTL", 3600)),
+    directory=os.environ.get("RESULT_CACHE_DIR") or None,
+    max_disk_bytes=int(os.environ.get("RESULT_CACHE_MAX_DISK_BYTES", 1024 * 1024 * 1024)),
+)
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from src.Statistics import StatisticsStream
+import os
+import threading
+import time
+import uuid
+
+class StatisticsSession:
+    """
+    Aggregated state of one analysis: call batches are merged into the
+    accumulators in O(batch) and the statistics can be read at any time.
+    """
+
+    def __init__(self, filters=None, options=None):
+        self.filters = filters
+        self.options = options or {}
+        self.stream = StatisticsStream(filters, **self.options)
+        self.calls = 0
+        self.batches = 0
+        self.lock = threading.Lock()
+
+    def add_many(self, calls):
+        with self.lock:
+            self.stream.add_many(calls)
+            self.calls += len(calls)
+            self.batches += 1
+            return self.info()
+
+    def result(self):
+        with self.lock:
+            return self.stream.result()
+
+    def info(self):
+        return {"calls": self.calls, "batches": self.batches, "filters": self.filters, **self.options}
+
+class SessionStore:
+    """LRU + idle TTL registry of statistics sessions."""
+
+    def __init__(self, max_sessions=1024, ttl=24 * 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.sessions = OrderedDict()  # id -> (last_used, session)
+        self.lock = threading.Lock()
+
+    def create(self, filters=None, options=None):
+        """`options` are the statistics_generator keyword arguments (enrich, top_k, ...)."""
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.sessions[session_id] = (time.time(), StatisticsSession(filters, options))
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return session_id
+
+    def get(self, session_id):
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return None
+            last_used, session = entry
+            if last_used + self.ttl < time.time():
+                del self.sessions[session_id]
+                return None
+            self.sessions[session_id] = (time.time(), session)
+            self.sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+session_store = SessionStore(
+    max_sessions=int(os.environ.get("MAX_SESSIONS", 1024)),
+    ttl=int(os.environ.get("SESSION_TTL", 24 * 3600)),
+)
@@ -1,32 +1,239 @@
+from array import array
+from dateutil.parser import isoparse
+from src.CallRecord import canonical_number, epoch_seconds
+from src.FastJson import dumps, loads
+from src.StreamingJson import iter_json_list
 from typing import List
+import tempfile
 
-def group_similar_values_across_sources(calls: List[dict]):
+SKIP_KEYS = {"app", "type", "source"}
+# First-pass marker of a pair seen in two or more sources
+MULTIPLE_SOURCES = object()
+
+class SpooledCallStore:
+    """
+    Append-only call storage on a temporary file (one JSON line per call),
+    so only offsets stay in memory until a group actually needs its calls.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.offsets = array('q')
+        self.end = 0
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, call):
+        line = dumps(call) + b"\n"
+        self.file.seek(self.end)
+        self.file.write(line)
+        self.offsets.append(self.end)
+        self.end += len(line)
+
+    def __getitem__(self, call_id):
+        self.file.seek(self.offsets[call_id])
+        return loads(self.file.readline())
+
+    def __iter__(self):
+        """Reads the calls back in order with one sequential pass over the file."""
+        self.file.seek(0)
+        for _ in range(len(self.offsets)):
+            yield loads(self.file.readline())
+
+    def close(self):
+        self.file.close()
+
+class SimilarityIndex:
+    """
+    Incremental index behind group_similar_values_across_sources.
+
+    Grouping takes two passes. While calls are added, `groups` maps the hash
+    of every (field, value) pair to its first source, or to MULTIPLE_SOURCES
+    once a second source carries it. Emitting groups re-reads the stored calls
+    and collects call ids only for the flagged pairs, comparing the pairs
+    themselves so a hash collision cannot merge groups. Call objects live in
+    `calls` (a list, or a SpooledCallStore to bound memory) and are only
+    materialized when a group spanning two or more sources is emitted.
+
+    `target_field` / `target_value` restrict indexing to one field and/or to
+    values whose str() equals target_value; calls without a matching pair
+    are not stored at all.
+
+    `normalize_numbers` groups the 'number' field by its E.164 form, so
+    +77011234567, 87011234567 and 7011234567 match. `time_window` (seconds)
+    adds 'time_window' groups: calls are sorted by timestamp and swept with two
+    pointers, each call anchoring a group with the calls of other sources that
+    follow it by at most time_window seconds.
+    """
+
+    def __init__(self, calls=None, skip_keys=SKIP_KEYS, target_field=None, target_value=None,
+                 normalize_numbers=False, time_window=None):
+        self.calls = calls if calls is not None else []
+        self.skip_keys = skip_keys
+        self.target_field = target_field
+        self.target_value = target_value
+        self.normalize_numbers = normalize_numbers
+        self.time_window = time_window
+        self.groups = {}
+        # Source of each stored call, so compact groups can count sources without loading calls
+        self.call_sources = []
+        # (epoch seconds, call id) of every stored call, for the time window join
+        self.call_times = []
+
+    def _pairs(self, call):
+        if self.target_field is not None:
+            if self.target_field in self.skip_keys or self.target_field not in call:
+                return ()
+            pairs = ((self.target_field, call[self.target_field]),)
+        else:
+            pairs = [(key, value) for key, value in call.items() if key not in self.skip_keys]
+        if self.normalize_numbers:
+            pairs = [(key, canonical_number(value) if key == "number" else value) for key, value in pairs]
+        if self.target_value is not None:
+            pairs = [(key, value) for key, value in pairs if str(value) == self.target_value]
+        return pairs
+
+    def add(self, call):
+        pairs = self._pairs(call)
+        epoch = None
+        timestamp = call.get("timestamp") if self.time_window is not None else None
+        if timestamp and isinstance(timestamp, str):
+            try:
+                epoch = epoch_seconds(isoparse(timestamp))
+            except ValueError:
+                # Calls with an unreadable timestamp are only left out of the time window join
+                pass
+        if not pairs and epoch is None:
+            return
+        call_id = len(self.calls)
+        self.calls.append(call)
+        source = call["source"]
+        self.call_sources.append(source)
+        if epoch is not None:
+            self.call_times.append((epoch, call_id))
+        groups = self.groups
+        for pair in pairs:
+            pair_hash = hash(pair)
+            first_source = groups.get(pair_hash, source)
+            if first_source is MULTIPLE_SOURCES:
+                continue
+            groups[pair_hash] = source if first_source == source else MULTIPLE_SOURCES
+
+    def _window_groups(self):
+        """
+        Two-pointer sweep over the sorted call times: every call anchors the calls of
+        other sources within [its time, its time + time_window], so no group spans more
+        than time_window seconds and each holds only cross-source matches of its anchor.
+        """
+        self.call_times.sort()
+        times = self.call_times
+        end = 0
+        for start, (epoch, call_id) in enumerate(times):
+            end = max(end, start + 1)
+            while end < len(times) and times[end][0] - epoch <= self.time_window:
+                end += 1
+            source = self.call_sources[call_id]
+            matches = [other for _, other in times[start + 1:end] if self.call_sources[other] != source]
+            if matches:
+                yield "time_window", self.calls[call_id]["timestamp"], [call_id] + matches
+
+    def _matched_groups(self):
+        """(field, value, call ids) of every group spanning at least two sources."""
+        groups = self.groups
+        matched = {}  # (field, value) -> [first source, seen in another source, call ids]
+        for call_id, call in enumerate(self.calls):
+            source = self.call_sources[call_id]
+            for pair in self._pairs(call):
+                if groups.get(hash(pair), source) is not MULTIPLE_SOURCES:
+                    continue
+                group = matched.get(pair)
+                if group is None:
+                    matched[pair] = [source, False, [call_id]]
+                else:
+                    if not group[1] and group[0] != source:
+                        group[1] = True
+                    group[2].append(call_id)
+        for (field, value), (_, multiple_sources, call_ids) in matched.items():
+            if multiple_sources:
+                yield field, value, call_ids
+        if self.time_window is not None:
+            yield from self._window_groups()
+
+    def iter_groups(self):
+        """Yields the groups spanning at least two sources, building each one lazily."""
+        calls = self.calls
+        for field, value, call_ids in self._matched_groups():
+            yield {
+                "field": field,
+                "value": value,
+                "objects": [calls[call_id] for call_id in call_ids]
+            }
+
+    def iter_compact_groups(self, table):
+        """
+        Like iter_groups, but each group lists positions in `table` (which is
+        filled with call ids on first use) plus per-source call counts.
+        """
+        positions = {}
+        for field, value, call_ids in self._matched_groups():
+            group_calls = []
+            sources = {}
+            for call_id in call_ids:
+                position = positions.get(call_id)
+                if position is None:
+                    position = positions[call_id] = len(table)
+                    table.append(call_id)
+                group_calls.append(position)
+                source = self.call_sources[call_id]
+                sources[source] = sources.get(source, 0) + 1
+            yield {"field": field, "value": value, "calls": group_calls, "sources": sources}
+
+    def compact_result(self):
+        """{"groups": [...], "calls": [...]}: every matched call appears once in 'calls'."""
+        table = []
+        groups = list(self.iter_compact_groups(table))
+        return {"groups": groups, "calls": [self.calls[call_id] for call_id in table]}
+
+    def iter_compact_json(self):
+        """compact_result encoded chunk by chunk, for streaming responses."""
+        table = []
+        yield b'{"groups":'
+        yield from iter_json_list(self.iter_compact_groups(table))
+        yield b',"calls":'
+        yield from iter_json_list(self.calls[call_id] for call_id in table)
+        yield b'}'
+
+def index_calls(index, calls, source):
+    """Feeds an iterable of call dicts into the index, tagging each call with `source`."""
+    for call in calls:
+        call["source"] = source
+        index.add(call)
+
+def group_similar_values_across_sources(calls: List[dict], target_field=None, target_value=None, compact=False,
+                                         normalize_numbers=False, time_window=None):
     """
     Groups call objects by each shared key-value pair (ignoring 'app', 'type', and 'source'),
     but only if that pair is present in objects coming from at least two different sources.
-    
+    Only the 'target_field' field and/or values equal to 'target_value' are grouped if given.
+
     Returns a list of dictionaries each with keys:
         - 'field': the field name
         - 'value': the common value
         - 'objects': the list of call objects (each with its source) sharing that key-value pair.
-    """
-    skip_keys = {"app", "type", "source"}
-    groups = {}
 
+    With 'compact' the result is {"groups": [...], "calls": [...]} instead: each call is listed
+    once in 'calls' and groups carry 'calls' (indices into it) and per-source 'sources' counts.
+    'normalize_numbers' and 'time_window' are passed on to SimilarityIndex.
+    """
+    index = SimilarityIndex(
+        target_field=target_field,
+        target_value=target_value,
+        normalize_numbers=normalize_numbers,
+        time_window=time_window
+    )
     for call in calls:
-        for key, value in call.items():
-            if key in skip_keys:
-                continue
-            group_key = (key, value)
-            groups.setdefault(group_key, []).append(call)
-
-    result = []
-    for (field, value), group_calls in groups.items():
-        sources = {call["source"] for call in group_calls}
-        if len(sources) > 1:
-            result.append({
-                "field": field,
-                "value": value,
-                "objects": group_calls
-            })
-    return result
\ No newline at end of file
+        index.add(call)
+    if compact:
+        return index.compact_result()
+    return list(index.iter_groups())
@@ -1,257 +1,178 @@
 from dateutil.parser import isoparse
-from collections import defaultdict
-from datetime import datetime
-import json
-import phonenumbers
-from phonenumbers import geocoder
-
-def filter_data(data, filters):
+from itertools import islice
+import os
+import time
+from src.CallRecord import epoch_seconds, to_record, to_records
+from src.Metrics import record, stage
+from src.Aggregation import (
+    accumulator_factories,
+    aggregate,
+    merge_results,
+    IncomingOutgoingAccumulator,
+    CallDurationAccumulator,
+    CallAppsAccumulator,
+    KeyContactsAccumulator,
+    ActivityPeriodsAccumulator,
+    CountryActivityAccumulator,
+    CityActivityAccumulator,
+)
+
+def _time_bound(value):
+    return epoch_seconds(isoparse(value)) if value else None
+
+# (filters key, cost, clause builder); cheaper clauses are evaluated first.
+# Each builder returns a boolean expression over `val` (a CallRecord) and the
+# filter value bound to `name`, or None when the value does not filter anything.
+FILTER_CLAUSES = [
+    ("type", 1, lambda value, name: f"val.type == {name}" if value is not None else None),
+    ("app", 1, lambda value, name: f"val.app == {name}" if value is not None else None),
+    ("status", 1, lambda value, name: f"val.status == {name}" if value is not None else None),
+    ("phone_number", 1, lambda value, name: f"val.number == {name}" if value is not None else None),
+    ("apps", 2, lambda value, name: f"val.app in {name}" if value else None),
+    ("types", 2, lambda value, name: f"val.type in {name}" if value else None),
+    ("phone_numbers", 2, lambda value, name: f"val.number in {name}" if value else None),
+    ("min_duration", 2, lambda value, name: f"val.duration >= {name}" if value is not None else None),
+    ("max_duration", 2, lambda value, name: f"val.duration <= {name}" if value is not None else None),
+    ("number_prefix", 3, lambda value, name: (
+        f"((val.number or '').startswith({name}) or (val.normalized_number or '').startswith({name}))"
+        if value else None
+    )),
+    ("start_time", 4, lambda value, name: f"(val.epoch is not None and val.epoch >= {name})" if value is not None else None),
+    ("end_time", 4, lambda value, name: f"(val.epoch is not None and val.epoch <= {name})" if value is not None else None),
+]
+
+# Filter values are converted once, before they are bound into the predicate
+FILTER_VALUES = {
+    "apps": frozenset,
+    "types": frozenset,
+    "phone_numbers": frozenset,
+    "start_time": _time_bound,
+    "end_time": _time_bound,
+}
+
+def call_filter(filters):
+    """
+    Compiles the filters dict into one predicate over CallRecords, None if nothing is filtered.
+    Only the clauses that filter something are kept, cheapest first; filter values are
+    bound as constants of the generated function and never formatted into its source.
+    """
     if not filters:
-        return data
-    start_time = isoparse(filters.get("start_time")) if filters.get("start_time") else None
-    end_time = isoparse(filters.get("end_time")) if filters.get("end_time") else None
-
-    filtered_data = [
-        val for val in data
-        if (
-            (filters.get("phone_number") is None or val.get("number") == filters.get("phone_number")) and
-            (filters.get("type") is None or val.get("type") == filters.get("type")) and
-            (filters.get("app") is None or val.get("app") == filters.get("app")) and
-            (start_time is None or isoparse(val.get("timestamp")) >= start_time) and
-            (end_time is None or isoparse(val.get("timestamp")) <= end_time)
-        )
-    ]
-
-    return filtered_data
-def statistics_generator(data, filters = None):
-    result = {}
-    filtered_data = filter_data(data, filters)
-    incom_outgo_calls = get_incoming_outgoing_calls(filtered_data)
-    call_duration_statistics = get_call_duration_statistics(filtered_data, incom_outgo_calls[0], incom_outgo_calls[1])
-    call_apps = get_call_apps(filtered_data)
-    key_contacts = get_key_contacts(filtered_data)
-    activity_periods = get_most_active_periods(filtered_data)
-    country_activity = get_key_countries(filtered_data)
-    city_activity = get_key_cities(filtered_data)
-
-    result["incoming"] = incom_outgo_calls[0]
-    result["outgoing"] = incom_outgo_calls[1]
-    result["call_duration"] = call_duration_statistics
-    result["call_apps"] = call_apps
-    result["key_contacts"] = key_contacts
-    result["activity_periods"] = activity_periods
-    result["country_activity"] = country_activity
-    result["city_activity"] = city_activity
-    return result
+        return None
+    namespace = {}
+    clauses = []
+    for position, (key, cost, build) in enumerate(FILTER_CLAUSES):
+        value = filters.get(key)
+        convert = FILTER_VALUES.get(key)
+        if convert is not None and value is not None:
+            value = convert(value)
+        name = f"_{key}"
+        clause = build(value, name)
+        if clause is not None:
+            namespace[name] = value
+            clauses.append((cost, position, clause))
+    if not clauses:
+        return None
+    clauses.sort()
+    return eval("lambda val: " + " and ".join(clause for _, _, clause in clauses), namespace)
+
+# Records the lazy filters evaluate at a time, so the predicate can be timed without a clock read per call
+FILTER_BATCH_SIZE = 4096
+
+def filter_records(predicate, records):
+    """
+    Lazily keeps the records matching `predicate` (all of them if it is None), recording
+    the time spent in the predicate as the "filter" stage. Records are parsed before
+    each batch is timed, so only the filtering itself is measured.
+    """
+    if predicate is None:
+        return records
+    return _timed_filter(predicate, iter(records))
+
+def _timed_filter(predicate, records):
+    spent = 0.0
+    try:
+        while True:
+            batch = list(islice(records, FILTER_BATCH_SIZE))
+            if not batch:
+                break
+            start = time.perf_counter()
+            batch = list(filter(predicate, batch))
+            spent += time.perf_counter() - start
+            yield from batch
+    finally:
+        record("filter", spent)
+
+def iter_filtered(data, filters):
+    """Lazily converts and filters calls, so any iterable (e.g. a parser) can feed the accumulators."""
+    return filter_records(call_filter(filters), (to_record(call) for call in data))
+
+# "python" runs the single-pass accumulators, "pandas" the columnar backend
+STATISTICS_BACKEND = os.environ.get("STATISTICS_BACKEND", "python")
+
+def statistics_generator(data, filters = None, accumulators = None, backend = None, enrich = False,
+                         top_k = None, contact_sketch = False):
+    """
+    `top_k` limits key_contacts to the most called contacts and adds key_contacts_others;
+    `contact_sketch` counts contacts with a bounded approximate sketch (python backend only).
+    """
+    with stage("statistics", profile=True):
+        if (backend or STATISTICS_BACKEND) == "pandas":
+            from src.ColumnarStatistics import columnar_statistics
+            # The columnar backend parses and filters the raw calls itself
+            return columnar_statistics(data, filters, enrich, top_k)
+        if accumulators is None:
+            accumulators = accumulator_factories(enrich, top_k, contact_sketch)
+        accumulators = [factory() for factory in accumulators]
+        # Calls are parsed, filtered and aggregated one at a time, `data` may be a generator
+        return aggregate(iter_filtered(data, filters), accumulators)
+
+class StatisticsStream:
+    """
+    statistics_generator fed in batches: calls are filtered and added to the
+    accumulators as they arrive and only the accumulator state is kept.
+    """
+
+    def __init__(self, filters=None, enrich=False, accumulators=None, top_k=None, contact_sketch=False):
+        if accumulators is None:
+            accumulators = accumulator_factories(enrich, top_k, contact_sketch)
+        self.accumulators = [factory() for factory in accumulators]
+        self.adders = [accumulator.add for accumulator in self.accumulators]
+        self.predicate = call_filter(filters)
+
+    def add_many(self, calls):
+        records = map(to_record, calls)
+        if self.predicate is not None:
+            records = list(records)
+            with stage("filter"):
+                records = list(filter(self.predicate, records))
+        for val in records:
+            for add in self.adders:
+                add(val)
+
+    def result(self):
+        return merge_results(self.accumulators)
+
+def _section(accumulator, data, key):
+    return aggregate(to_records(data), [accumulator]).get(key)
 
 def get_incoming_outgoing_calls(data):
-    incoming = 0
-    outgoing = 0
-
-    for val in data:
-        if val.get("type") == "incoming":
-            incoming += 1
-        elif val.get("type") == "outgoing":
-            outgoing += 1
-    return (incoming, outgoing)
+    counts = aggregate(to_records(data), [IncomingOutgoingAccumulator()])
+    return (counts["incoming"], counts["outgoing"])
 
 def get_call_duration_statistics(data, incoming_calls=1, outgoing_calls=1):
-    if not data:
-        return {
-            'total_calls': {
-                'amount': 0,
-                'average_duration': 0,
-                'max_duration': 0,
-                'min_duration': 0
-            },
-            'incoming_calls': {
-                'amount': 0,
-                'average_duration': 0,
-                'max_duration': 0,
-                'min_duration': 0
-            },
-            'outgoing_calls': {
-                'amount': 0,
-                'average_duration': 0,
-                'max_duration': 0,
-                'min_duration': 0
-            }
-        }
-
-    total_calls = len(data)
-    average_duration = 0
-    max_duration = float('-inf')
-    min_duration = float('inf')
-
-    income_average_duration = 0
-    max_income_duration = float('-inf')
-    min_income_duration = float('inf')
-
-    outgoing_average_duration = 0
-    max_outgoing_duration = float('-inf')
-    min_outgoing_duration = float('inf')
-
-    for val in data:
-        duration = val.get("duration", 0)
-        average_duration += duration
-
-        if duration > max_duration:
-            max_duration = duration
-        if duration < min_duration:
-            min_duration = duration
-
-        if val.get("type") == "incoming":
-            income_average_duration += duration
-            if duration > max_income_duration:
-                max_income_duration = duration
-            if duration < min_income_duration:
-                min_income_duration = duration
-        elif val.get("type") == "outgoing":
-            outgoing_average_duration += duration
-            if duration > max_outgoing_duration:
-                max_outgoing_duration = duration
-            if duration < min_outgoing_duration:
-                min_outgoing_duration = duration
-
-    average_duration /= total_calls
-    
-    income_average_duration = income_average_duration / incoming_calls if incoming_calls else 0
-    outgoing_average_duration = outgoing_average_duration / outgoing_calls if outgoing_calls else 0
-
-    min_duration = min_duration if min_duration != float('inf') else 0
-    min_income_duration = min_income_duration if min_income_duration != float('inf') else 0
-    min_outgoing_duration = min_outgoing_duration if min_outgoing_duration != float('inf') else 0
-
-    result = {
-        'total_calls': {
-            'amount': total_calls,
-            'average_duration': round(average_duration, 1),
-            'max_duration': max_duration,
-            'min_duration': min_duration
-        },
-        'incoming_calls': {
-            'amount': incoming_calls,
-            'average_duration': round(income_average_duration, 1),
-            'max_duration': max_income_duration,
-            'min_duration': min_income_duration
-        },
-        'outgoing_calls': {
-            'amount': outgoing_calls,
-            'average_duration': round(outgoing_average_duration, 1),
-            'max_duration': max_outgoing_duration,
-            'min_duration': min_outgoing_duration
-        }
-    }
-
-    return result
-
+    return _section(CallDurationAccumulator(incoming_calls, outgoing_calls), data, "call_duration")
 
 def get_call_apps(data):
-    app_calls = defaultdict(lambda: {"incoming": 0, "outgoing": 0})
-    
-    for val in data:
-        app = val.get("app")
-        call_type = val.get("type")
-        if app and call_type:
-            if call_type in ["incoming", "outgoing"]:
-                app_calls[app][call_type] += 1
-
-    app_calls = dict(app_calls)
-    return app_calls
+    return _section(CallAppsAccumulator(), data, "call_apps")
 
 def get_key_contacts(data):
-    contact_calls = defaultdict(int)
-
-    for val in data:
-        phone_number = val.get("number")
-        if phone_number:
-            cc_key = phone_number + ' ' + val.get("name")
-            contact_calls[cc_key] += 1
-
-    sorted_contacts = dict(sorted(contact_calls.items(), key=lambda x: x[1], reverse=True))
-    return sorted_contacts
-
+    return _section(KeyContactsAccumulator(), data, "key_contacts")
 
 def get_most_active_periods(data):
-    time_periods = {
-        'morning_calls': (6, 12),       # 6 AM to 12 PM
-        'afternoon_calls': (12, 18),    # 12 PM to 6 PM
-        'evening_calls': (18, 24),      # 6 PM to 12 AM
-        'night_calls': (0, 6)           # 12 AM to 6 AM
-    }
-
-    activity_counts = defaultdict(lambda: defaultdict(int))
-
-    for val in data:
-        timestamp = isoparse(val.get("timestamp"))
-        if timestamp:
-            call_time = timestamp
-            day = call_time.date()
-            hour = call_time.hour
-
-            for period, (start_hour, end_hour) in time_periods.items():
-                if start_hour <= hour < end_hour or (start_hour == 0 and hour < end_hour):
-                    activity_counts[str(day)][period] += 1
-                    break
-
-    activity_counts = {
-        day: {
-            **periods,
-            'total_calls': sum(periods.values())
-        }
-        for day, periods in activity_counts.items()
-    }
-
-    sorted_activity = dict(sorted(activity_counts.items(), key=lambda x: sum(x[1].values()), reverse=True))
-    return sorted_activity
+    return _section(ActivityPeriodsAccumulator(), data, "activity_periods")
 
 def get_key_countries(data):
-    with open('country_codes.json', 'r', encoding='utf-8') as file:
-        countries = json.load(file)
-
-    country_code_map = {}
-    for country, codes in countries.items():
-        for code in codes:
-            country_code_map[code] = country
-
-    country_call_counts = defaultdict(int)
-    for call in data:
-        number = call['number']
-        matched_country = None
-        for code in sorted(country_code_map.keys(), key=len, reverse=True):
-            if number.startswith(code):
-                matched_country = country_code_map[code]
-                break
-        if matched_country:
-            country_call_counts[matched_country] += 1
-        else:
-            country_call_counts['Unknown'] += 1
-    return country_call_counts
+    return _section(CountryActivityAccumulator(), data, "country_activity")
 
 def get_key_cities(data):
-    with open('city_codes.json', 'r', encoding='utf-8') as file:
-        cities = json.load(file)
-
-    city_code_map = {}
-    for city in cities.items():
-        city_code_map[city[1]] = city[0]
-    
-    city_call_counts = defaultdict(int)
-    for call in data:
-        if call['app'] != "unknown": continue
-        if call['number'].startswith('+7'):
-            number=call['number'][2:]
-        elif call['number'].startswith('8'):
-            number=call['number'][1:]
-        else: continue
-        matched_city = None
-        for code in sorted(city_code_map.keys(), key=len, reverse=True):
-            if number.startswith(code):
-                matched_city = city_code_map[code]
-                break
-        if matched_city:
-            city_call_counts[matched_city] += 1
-            print(call['number'])
-        else:
-            city_call_counts['mobile_call'] += 1
-    return city_call_counts
\ No newline at end of file
+    return _section(CityActivityAccumulator(), data, "city_activity")
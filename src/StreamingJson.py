@@ -0,0 +1,293 @@
+from src.FastJson import dumps, loads
+import codecs
+import json
+import re
+
+_whitespace = re.compile(r'\s*')
+_decoder = json.JSONDecoder()
+# Characters that may follow a complete number
+_number_delimiters = frozenset(' \t\n\r,]}')
+# Skip scanner: characters that matter inside containers, the rest of a string, the end of a bare scalar
+_container_special = re.compile(r'["\[\]{}]')
+_string_body = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+_scalar_end = re.compile(r'[\s,\]}]')
+_closers = {'[': ']', '{': '}'}
+
+class JsonArrayStream:
+    """
+    Push parser yielding the items of a JSON array as soon as each one is
+    complete. With `key` the document must be an object and the array is the
+    value of that top-level key (other top-level values are skipped).
+    """
+
+    def __init__(self, key=None):
+        self.key = key
+        self.buffer = ''
+        self.pos = 0
+        self.state = 'object' if key is not None else 'array'
+        self.found = False
+        self.closed = False
+        # Set after a key/value pair or an array item, until the next ',' is consumed
+        self.need_comma = False
+        # Scanner state of a skipped value: closing brackets still expected, inside a string, inside a bare scalar
+        self.skip_closers = []
+        self.skip_in_string = False
+        self.skip_in_scalar = False
+
+    def _skip_whitespace(self):
+        self.pos = _whitespace.match(self.buffer, self.pos).end()
+        return self.buffer[self.pos] if self.pos < len(self.buffer) else None
+
+    def _decode(self):
+        """Decodes the next value, or returns (None, False) when it may still be incomplete."""
+        try:
+            value, end = _decoder.raw_decode(self.buffer, self.pos)
+        except json.JSONDecodeError:
+            if self.closed:
+                raise
+            return None, False
+        if not self.closed and isinstance(value, (int, float)) and not isinstance(value, bool):
+            # A number cut by a chunk boundary ("12." or "1e") decodes as its prefix,
+            # so it is only complete once a delimiter follows it
+            if end == len(self.buffer) or self.buffer[end] not in _number_delimiters:
+                return None, False
+        self.pos = end
+        return value, True
+
+    def _skip_value(self):
+        """
+        Consumes the value being skipped without decoding it, tracking only
+        strings and bracket nesting; returns False while it may still be
+        incomplete, with the scanner state kept for the next chunk.
+        """
+        buffer, pos, closers = self.buffer, self.pos, self.skip_closers
+        while True:
+            if self.skip_in_string:
+                # Stops at the closing quote, or at the end of the buffer before any unfinished escape
+                pos = _string_body.match(buffer, pos).end()
+                if pos == len(buffer) or buffer[pos] != '"':
+                    self.pos = pos
+                    return False
+                pos += 1
+                self.skip_in_string = False
+                if not closers:
+                    break
+            elif closers:
+                match = _container_special.search(buffer, pos)
+                if match is None:
+                    self.pos = len(buffer)
+                    return False
+                pos = match.start()
+                char = buffer[pos]
+                pos += 1
+                if char == '"':
+                    self.skip_in_string = True
+                elif char in _closers:
+                    closers.append(_closers[char])
+                elif char != closers.pop():
+                    raise json.JSONDecodeError("Mismatched '" + char + "'", buffer, pos - 1)
+                elif not closers:
+                    break
+            else:
+                char = buffer[pos]
+                if not self.skip_in_scalar and char in '"[{':
+                    pos += 1
+                    if char == '"':
+                        self.skip_in_string = True
+                    else:
+                        closers.append(_closers[char])
+                    continue
+                if not self.skip_in_scalar and char in ',:]}':
+                    raise json.JSONDecodeError("Expecting value", buffer, pos)
+                match = _scalar_end.search(buffer, pos)
+                if match is None and not self.closed:
+                    self.skip_in_scalar = True
+                    self.pos = len(buffer)
+                    return False
+                pos = match.start() if match is not None else len(buffer)
+                self.skip_in_scalar = False
+                break
+        self.pos = pos
+        return True
+
+    def _expect(self, char):
+        if self._skip_whitespace() != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buffer, self.pos)
+        self.pos += 1
+
+    def _parse(self):
+        items = []
+        while True:
+            char = self._skip_whitespace()
+            if char is None:
+                break
+            if self.state == 'object':
+                if char != '{':
+                    # Not an object, so the key cannot be present
+                    self.state = 'not_object'
+                    break
+                self.pos += 1
+                self.state = 'key'
+            elif self.state == 'key':
+                if char == '}':
+                    self.pos += 1
+                    self.state = 'done'
+                    continue
+                if char == ',' and self.need_comma:
+                    self.pos += 1
+                    self.need_comma = False
+                    continue
+                if self.need_comma:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", self.buffer, self.pos)
+                start = self.pos
+                key, complete = self._decode()
+                if not complete:
+                    break
+                if self._skip_whitespace() is None:
+                    self.pos = start
+                    break
+                self._expect(':')
+                self.state = 'array' if key == self.key else 'skip'
+            elif self.state == 'skip':
+                if not self._skip_value():
+                    break
+                self.state = 'key'
+                self.need_comma = True
+            elif self.state == 'array':
+                if char != '[':
+                    if self.key is None:
+                        raise json.JSONDecodeError("Expecting '['", self.buffer, self.pos)
+                    # The key holds something other than an array, skip it like any other value
+                    self.state = 'skip'
+                    continue
+                self.pos += 1
+                self.found = True
+                self.state = 'items'
+                self.need_comma = False
+            elif self.state == 'items':
+                if char == ']':
+                    self.pos += 1
+                    self.found = True
+                    self.state = 'key' if self.key is not None else 'done'
+                    self.need_comma = True
+                    continue
+                if char == ',' and self.need_comma:
+                    self.pos += 1
+                    self.need_comma = False
+                    continue
+                if self.need_comma:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", self.buffer, self.pos)
+                item, complete = self._decode()
+                if not complete:
+                    break
+                items.append(item)
+                self.need_comma = True
+            else:
+                break
+        # Drop consumed input so the buffer only holds the item being decoded
+        self.buffer = self.buffer[self.pos:]
+        self.pos = 0
+        return items
+
+    def feed(self, text):
+        self.buffer += text
+        return self._parse()
+
+    def close(self):
+        self.closed = True
+        items = self._parse()
+        if self.state == 'not_object':
+            return items
+        if self.state not in ('done', 'key') or self._skip_whitespace() is not None:
+            raise json.JSONDecodeError("Unexpected end of JSON document", self.buffer, self.pos)
+        return items
+
+class NdjsonStream:
+    """Push parser for newline-delimited JSON: one value per line, blank lines are skipped."""
+
+    def __init__(self):
+        self.buffer = ''
+        self.line = 0
+
+    def _decode(self, lines):
+        items = []
+        for line in lines:
+            self.line += 1
+            if line.strip():
+                try:
+                    items.append(loads(line))
+                except ValueError as e:
+                    raise ValueError(f"line {self.line}: {e}") from e
+        return items
+
+    def feed(self, text):
+        lines = (self.buffer + text).split('\n')
+        self.buffer = lines.pop()
+        return self._decode(lines)
+
+    def close(self):
+        lines, self.buffer = [self.buffer], ''
+        return self._decode(lines)
+
+class CallUploadStream:
+    """
+    Push parser for a streamed call upload, fed with raw bytes. With `ndjson`
+    every line is a call; otherwise the body is a JSON array of calls or a
+    {"call_history": [...]} document, told apart by its first character.
+    close() raises KeyError if such a document has no 'call_history' array.
+    """
+
+    def __init__(self, ndjson=False):
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.parser = NdjsonStream() if ndjson else None
+        self.pending = ''
+
+    def _feed_text(self, text):
+        if self.parser is None:
+            self.pending += text
+            start = self.pending.lstrip()
+            if not start:
+                return []
+            self.parser = JsonArrayStream(None if start[0] == '[' else "call_history")
+            text, self.pending = self.pending, ''
+        return self.parser.feed(text)
+
+    def feed(self, chunk):
+        return self._feed_text(self.decoder.decode(chunk))
+
+    def close(self):
+        items = self._feed_text(self.decoder.decode(b"", final=True))
+        if self.parser is None:
+            return items
+        items.extend(self.parser.close())
+        if isinstance(self.parser, JsonArrayStream) and not self.parser.found:
+            raise KeyError(self.parser.key)
+        return items
+
+def iter_json_array(file, key=None, chunk_size=1 << 16):
+    """
+    Yields the items of a JSON array read incrementally from a binary file.
+    Raises KeyError if the document has no top-level `key` array.
+    """
+    stream = JsonArrayStream(key)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in iter(lambda: file.read(chunk_size), b""):
+        yield from stream.feed(decoder.decode(chunk))
+    yield from stream.feed(decoder.decode(b"", final=True))
+    yield from stream.close()
+    if not stream.found:
+        raise KeyError(key)
+
+def iter_json_list(items):
+    """Encodes an iterable as a JSON array chunk by chunk, for streaming responses."""
+    yield b'['
+    for index, item in enumerate(items):
+        yield (b',' if index else b'') + dumps(item)
+    yield b']'
+
+def iter_and_close(chunks, close):
+    """Passes chunks through and calls `close` once the consumer is done or disconnects."""
+    try:
+        yield from chunks
+    finally:
+        close()
@@ -0,0 +1,79 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from dateutil.parser import isoparse
+from src.CallRecord import epoch_seconds, to_records
+from src.Metrics import stage
+from src.Statistics import call_filter, filter_records
+import os
+import threading
+
+# Total number of parsed calls kept between requests, over all cached call histories
+TIME_INDEX_MAX_RECORDS = int(os.environ.get("TIME_INDEX_MAX_RECORDS", 2_000_000))
+
+class TimeIndex:
+    """
+    Parsed calls of one history plus their positions sorted by timestamp, so a
+    start_time/end_time range is two bisect lookups and a slice. Calls without
+    a timestamp never match a time range, like in call_filter.
+    """
+
+    def __init__(self, calls):
+        self.records = to_records(calls)
+        timed = sorted(
+            (record.epoch, position)
+            for position, record in enumerate(self.records)
+            if record.epoch is not None
+        )
+        self.times = array('d', (epoch for epoch, _ in timed))
+        self.order = array('q', (position for _, position in timed))
+
+    def __len__(self):
+        return len(self.records)
+
+    def positions(self, start_time=None, end_time=None):
+        """Positions of the calls within the range, in their original order."""
+        low = bisect_left(self.times, epoch_seconds(isoparse(start_time))) if start_time else 0
+        high = bisect_right(self.times, epoch_seconds(isoparse(end_time))) if end_time else len(self.times)
+        return sorted(self.order[low:high])
+
+    def select(self, filters):
+        """The records matching the filters dict: time range first, the other predicates within it."""
+        filters = filters or {}
+        if not filters.get("start_time") and not filters.get("end_time"):
+            return filter_records(call_filter(filters), self.records)
+        records = self.records
+        with stage("filter"):
+            positions = self.positions(filters.get("start_time"), filters.get("end_time"))
+        selected = (records[position] for position in positions)
+        return filter_records(call_filter({**filters, "start_time": None, "end_time": None}), selected)
+
+_indexes = OrderedDict()
+_indexed_records = 0
+_lock = threading.Lock()
+
+def get_time_index(calls_hash, calls):
+    """
+    TimeIndex of a call history, built once per content hash and kept in an
+    LRU bounded by the total number of records; histories larger than the
+    bound are indexed for the request but not kept.
+    """
+    global _indexed_records
+    with _lock:
+        index = _indexes.get(calls_hash)
+        if index is not None:
+            _indexes.move_to_end(calls_hash)
+            return index
+    index = TimeIndex(calls)
+    if len(index) > TIME_INDEX_MAX_RECORDS:
+        return index
+    with _lock:
+        previous = _indexes.pop(calls_hash, None)
+        if previous is not None:
+            _indexed_records -= len(previous)
+        _indexes[calls_hash] = index
+        _indexed_records += len(index)
+        while _indexed_records > TIME_INDEX_MAX_RECORDS:
+            _, evicted = _indexes.popitem(last=False)
+            _indexed_records -= len(evicted)
+    return index
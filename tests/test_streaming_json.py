@@ -0,0 +1,99 @@
+import io
+import json
+import random
+
+import pytest
+
+from src.StreamingJson import JsonArrayStream, iter_json_array
+
+ITEMS = [
+    {"type": "incoming", "number": "+7 (701) 555-01-02", "duration": 12.5e-3, "tags": [], "extra": {}},
+    {"text": "quote \" backslash \\ brackets ]}[{ comma , colon :", "unicode": "é中😀"},
+    -0, 1e10, 123456789, -1.25E+3, True, False, None, "", [], {},
+    [[1, [2, [3]]], {"a": {"b": {"c": [None, "\\\""]}}}],
+]
+SKIPPED = [
+    "plain", "ends with backslash \\", "\"quoted\" [not, a] {container}", 42, -3.5e-2, True, None,
+    [], {}, [1, "]", {"}": "[", "x": [[[]]]}], {"nested": {"call_history": [1, 2, 3]}},
+]
+
+def documents():
+    yield json.dumps(ITEMS, ensure_ascii=False), None
+    yield json.dumps(ITEMS, indent=2), None
+    yield json.dumps({"call_history": ITEMS}), "call_history"
+    before = {f"k{index}": value for index, value in enumerate(SKIPPED)}
+    after = {f"z{index}": value for index, value in enumerate(SKIPPED)}
+    for indent in (None, 1):
+        yield json.dumps({**before, "call_history": ITEMS, **after}, indent=indent, ensure_ascii=False), "call_history"
+        yield json.dumps({**after, "call_history": "not an array", **before, "call_history_2": ITEMS}, indent=indent), "call_history_2"
+
+def expected(text, key):
+    document = json.loads(text)
+    return document if key is None else document[key]
+
+def feed_in_chunks(text, key, rng):
+    stream = JsonArrayStream(key)
+    items, pos = [], 0
+    while pos < len(text):
+        size = rng.randint(1, 16)
+        items.extend(stream.feed(text[pos:pos + size]))
+        pos += size
+    items.extend(stream.close())
+    return items
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_chunk_splits_match_json_loads(seed):
+    rng = random.Random(seed)
+    for text, key in documents():
+        assert feed_in_chunks(text, key, rng) == expected(text, key)
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_iter_json_array_splits_utf8_bytes(chunk_size):
+    for text, key in documents():
+        file = io.BytesIO(text.encode('utf-8'))
+        assert list(iter_json_array(file, key, chunk_size=chunk_size)) == expected(text, key)
+
+def test_skipped_values_are_discarded_while_scanning():
+    skipped = json.dumps({"rows": [{"id": index, "text": "x\\\"" * 10} for index in range(5000)]})
+    text = '{"header": ' + skipped + ', "call_history": [1, 2]}'
+    stream = JsonArrayStream("call_history")
+    items, largest = [], 0
+    for pos in range(0, len(text), 100):
+        items.extend(stream.feed(text[pos:pos + 100]))
+        largest = max(largest, len(stream.buffer))
+    items.extend(stream.close())
+    assert items == [1, 2]
+    assert largest <= 100
+
+def test_skip_state_keeps_escape_split_across_chunks():
+    stream = JsonArrayStream("call_history")
+    items = []
+    for chunk in ['{"a": "\\', '"}', '", "call_history": [', '"\\', '""]}']:
+        items.extend(stream.feed(chunk))
+    items.extend(stream.close())
+    assert items == ['"']
+
+def test_skipped_scalar_split_across_chunks():
+    stream = JsonArrayStream("call_history")
+    items = []
+    for chunk in ['{"a": 12', '34', '5 ', ', "b": tr', 'ue}']:
+        items.extend(stream.feed(chunk))
+    items.extend(stream.close())
+    assert items == []
+    assert not stream.found
+
+def test_mismatched_bracket_in_skipped_value():
+    stream = JsonArrayStream("call_history")
+    with pytest.raises(json.JSONDecodeError):
+        stream.feed('{"a": [1, {"b": 2]], "call_history": []}')
+
+def test_truncated_document_raises_on_close():
+    stream = JsonArrayStream("call_history")
+    stream.feed('{"a": {"b": [1, 2')
+    with pytest.raises(json.JSONDecodeError):
+        stream.close()
+
+@pytest.mark.parametrize("text", ['{"calls": [1, 2]}', '{}', '[1, 2]', '{"call_history": {"a": [1]}}'])
+def test_missing_key_raises_key_error(text):
+    with pytest.raises(KeyError):
+        list(iter_json_array(io.BytesIO(text.encode('utf-8')), "call_history"))
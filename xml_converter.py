@@ -1,6 +1,17 @@
 import xml.etree.ElementTree as ET
+import argparse
+import gzip
 import json
-from datetime import datetime
+import os
+import sys
+
+NAMESPACE = 'http://pa.cellebrite.com/report/2.0'
+MODEL = f'{{{NAMESPACE}}}model'
+FIELD = f'{{{NAMESPACE}}}field'
+VALUE = f'{{{NAMESPACE}}}value'
+MULTI_MODEL_FIELD = f'{{{NAMESPACE}}}multiModelField'
+
+GZIP_MAGIC = b'\x1f\x8b'
 
 def convert_duration(duration_str):
     """Convert duration from 'HH:MM:SS' format to seconds."""
@@ -10,56 +21,122 @@ def convert_duration(duration_str):
     except ValueError:
         return 0
 
-def get_text(element, xpath, namespace):
-    """Get text content from an XML element or return an empty string if not found."""
-    found_element = element.find(xpath, namespace)
-    return found_element.text if found_element is not None else ""
+def open_report(file):
+    """Wraps a seekable binary file in a gzip reader if it starts with the gzip magic bytes."""
+    position = file.tell()
+    magic = file.read(2)
+    file.seek(position)
+    if magic == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=file, mode='rb')
+    return file
 
-def parse_xml_to_json(xml_path):
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
+def _collect_fields(element, fields, parties, in_party):
+    """
+    One walk over a Call model: the first value of every field (like './/field[@name=X]/value')
+    and the first Identifier/Name of the Parties models.
+    """
+    for child in element:
+        if child.tag == FIELD:
+            value = child.find(VALUE)
+            if value is not None:
+                name = child.get('name')
+                text = value.text or ""
+                if name not in fields:
+                    fields[name] = text
+                if in_party and name not in parties:
+                    parties[name] = text
+            continue
+        if child.tag == MULTI_MODEL_FIELD and child.get('name') == 'Parties':
+            for party in child:
+                _collect_fields(party, fields, parties, party.tag == MODEL)
+            continue
+        _collect_fields(child, fields, parties, False)
 
-    # Extract namespace
-    namespace = {'ns': 'http://pa.cellebrite.com/report/2.0'}
+def call_from_model(call):
+    fields = {}
+    parties = {}
+    _collect_fields(call, fields, parties, False)
+    return {
+        "type": fields.get("Direction", "").lower(),
+        "app": fields.get("Source") or "unknown",
+        "timestamp": fields.get("TimeStamp", ""),
+        "duration": convert_duration(fields.get("Duration", "")),
+        "status": fields.get("Status") or "unknown",
+        "number": parties.get("Identifier", ""),
+        "name": parties.get("Name", "")
+    }
 
-    call_history = []
-    
-    for call in root.findall('.//ns:model[@type="Call"]', namespace):
-        # Extract fields
-        direction = get_text(call, './/ns:field[@name="Direction"]/ns:value', namespace).lower()
-        app = get_text(call, './/ns:field[@name="Source"]/ns:value', namespace) or "unknown"
-        timestamp = get_text(call, './/ns:field[@name="TimeStamp"]/ns:value', namespace)
-        duration_str = get_text(call, './/ns:field[@name="Duration"]/ns:value', namespace)
-        duration = convert_duration(duration_str)
-        status = get_text(call, './/ns:field[@name="Status"]/ns:value', namespace) or "unknown"
-        
-        # Get caller number and name
-        number = get_text(call, './/ns:multiModelField[@name="Parties"]/ns:model/ns:field[@name="Identifier"]/ns:value', namespace)
-        name = get_text(call, './/ns:multiModelField[@name="Parties"]/ns:model/ns:field[@name="Name"]/ns:value', namespace)
+def iter_calls(source):
+    """
+    Streams the calls of a Cellebrite XML report (path or binary file, optionally gzipped),
+    yielding each call dict as soon as its model[@type="Call"] element is closed.
+    Processed elements are cleared and detached so memory stays flat on multi-GB reports.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            yield from iter_calls(file)
+        return
 
-        # Construct the call entry
-        call_data = {
-            "type": direction,
-            "app": app,
-            "timestamp": timestamp,
-            "duration": duration,
-            "status": status,
-            "number": number,
-            "name": name
-        }
-        call_history.append(call_data)
+    stack = []
+    model_depth = 0
+    for event, element in ET.iterparse(open_report(source), events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            if element.tag == MODEL:
+                model_depth += 1
+            continue
 
-    return {"call_history": call_history}
+        stack.pop()
+        if element.tag == MODEL:
+            model_depth -= 1
+            if element.get('type') == 'Call':
+                yield call_from_model(element)
+        # Elements inside a model are released together with their outermost model
+        if model_depth == 0:
+            element.clear()
+            if stack:
+                stack[-1].remove(element)
 
-# File paths
-xml_file = r'C:\Users\timur\OneDrive\Рабочий стол\My\AITU project\Call_history_api\Report.xml'
-output_json = r'C:\Users\timur\OneDrive\Рабочий стол\My\AITU project\Call_history_api\xiaomi_test.json'
+def parse_xml_to_json(xml_path):
+    return {"call_history": list(iter_calls(xml_path))}
 
-# Convert XML to JSON
-json_data = parse_xml_to_json(xml_file)
+def write_json(calls, output, indent=4):
+    """Writes {"call_history": [...]} incrementally, one call at a time."""
+    pad = ' ' * indent
+    output.write(f'{{\n{pad}"call_history": [' if indent else '{"call_history": [')
+    for index, call in enumerate(calls):
+        separator = ',' if index else ''
+        if indent:
+            body = json.dumps(call, indent=indent, ensure_ascii=False).replace('\n', '\n' + pad * 2)
+            output.write(f'{separator}\n{pad * 2}{body}')
+        else:
+            output.write(separator + json.dumps(call, ensure_ascii=False))
+    output.write(f'\n{pad}]\n}}\n' if indent else ']}\n')
 
-# Save JSON data to file
-with open(output_json, 'w', encoding='utf-8') as f:
-    json.dump(json_data, f, indent=4, ensure_ascii=False)
+def write_ndjson(calls, output):
+    for call in calls:
+        output.write(json.dumps(call, ensure_ascii=False) + '\n')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a Cellebrite XML report into call history JSON.")
+    parser.add_argument('xml_file', help="Cellebrite XML report (.xml or .xml.gz)")
+    parser.add_argument('output', nargs='?', help="Output file, stdout if omitted")
+    parser.add_argument('--ndjson', action='store_true', help="Write one call per line instead of a JSON document")
+    parser.add_argument('--indent', type=int, default=4, help="JSON indentation, 0 for compact output")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        calls = iter_calls(args.xml_file)
+        if args.ndjson:
+            write_ndjson(calls, output)
+        else:
+            write_json(calls, output, args.indent)
+    finally:
+        if args.output:
+            output.close()
+    if args.output:
+        print(f"Conversion complete! JSON data saved to {args.output}", file=sys.stderr)
 
-print(f"Conversion complete! JSON data saved to {output_json}")
+if __name__ == "__main__":
+    main()